@@ -70,8 +70,10 @@ class Header(_HeaderFields):
 
 class Cr2(Raw):
 
-    def __init__(self, blob=None, file=None, filename=None):
-        super(Cr2, self).__init__(blob=blob, file=file, filename=filename)
+    def __init__(self, blob=None, file=None, filename=None, pool=None,
+                 source=None):
+        super(Cr2, self).__init__(blob=blob, file=file, filename=filename,
+                                  pool=pool, source=source)
 
         pos = self.tell()
         self.header = Header(self.read(16))
@@ -93,11 +95,21 @@ class Cr2(Raw):
         """Read a quarter sized image as RGB data from the CR2 file."""
         return self._get_image_data()
 
+    @property
+    def preview_image_header(self):
+        """Probe the size of the preview image without reading it."""
+        return self._get_image_header()
+
     @property
     def thumbnail_image(self):
         """Read a thumbnail image from the CR2."""
         return self._get_image_data(num=1)
 
+    @property
+    def thumbnail_image_header(self):
+        """Probe the size of the thumbnail image without reading it."""
+        return self._get_image_header(num=1)
+
     @property
     def uncompressed_full_size_image(self):
         """Read uncompressed JPEG data with no WB settings from the CR2."""
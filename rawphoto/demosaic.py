@@ -0,0 +1,419 @@
+from rawphoto.stats import iter_raw_rows
+
+import mmap
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Kernels for bilinear interpolation, normalized by the weight of the known
+# samples under them (so they work for any CFA pattern).
+_bilinear_kernel = [
+    [1, 2, 1],
+    [2, 4, 2],
+    [1, 2, 1],
+]
+
+# Gradient corrected kernels from Malvar, He, and Cutler, "High-quality
+# linear interpolation for demosaicing of Bayer-patterned color images",
+# scaled by 8.
+_malvar_green = [
+    [0, 0, -1, 0, 0],
+    [0, 0, 2, 0, 0],
+    [-1, 2, 4, 2, -1],
+    [0, 0, 2, 0, 0],
+    [0, 0, -1, 0, 0],
+]
+# Red or blue at a green pixel, where that color is in the same row.
+_malvar_row = [
+    [0, 0, 0.5, 0, 0],
+    [0, -1, 0, -1, 0],
+    [-1, 4, 5, 4, -1],
+    [0, -1, 0, -1, 0],
+    [0, 0, 0.5, 0, 0],
+]
+# Red or blue at a green pixel, where that color is in the same column.
+_malvar_column = [list(r) for r in zip(*_malvar_row)]
+# Red at a blue pixel or blue at a red pixel.
+_malvar_diagonal = [
+    [0, 0, -1.5, 0, 0],
+    [0, 2, 0, 2, 0],
+    [-1.5, 0, 6, 0, -1.5],
+    [0, 2, 0, 2, 0],
+    [0, 0, -1.5, 0, 0],
+]
+
+# The border (in pixels) each method needs around a tile.
+borders = {
+    'bilinear': 1,
+    'malvar': 2,
+}
+
+# Arrays shared with worker processes, inherited when they are forked.
+_shared = {}
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("Demosaicing requires numpy")
+
+
+def _convolve(data, kernel, border):
+    """Correlate the center of a padded array with a small kernel.
+
+    Only the taps that are non-zero are visited, each as a shifted slice of
+    the whole array.
+
+    Args:
+        data - A 2D float array with border pixels of padding on each side.
+        kernel - A square list of lists with at most 2 * border + 1 rows.
+        border - The padding around data.
+    """
+    height = data.shape[0] - 2 * border
+    width = data.shape[1] - 2 * border
+    offset = border - len(kernel) // 2
+    out = numpy.zeros((height, width), dtype=numpy.float32)
+    for y, row in enumerate(kernel):
+        for x, weight in enumerate(row):
+            if weight:
+                out += weight * data[offset + y:offset + y + height,
+                                     offset + x:offset + x + width]
+    return out
+
+
+def _bilinear_tile(data, colors, border):
+    """Bilinear demosaic of a padded tile.
+
+    Args:
+        data - The padded CFA samples of the tile as float32.
+        colors - The color (0, 1, or 2) of each sample in data.
+        border - The padding around the tile.
+    """
+    center = (slice(border, data.shape[0] - border),
+              slice(border, data.shape[1] - border))
+    out = numpy.empty(data[center].shape + (3,), dtype=numpy.float32)
+    for color in range(3):
+        mask = (colors == color).astype(numpy.float32)
+        weights = _convolve(mask, _bilinear_kernel, border)
+        values = _convolve(data * mask, _bilinear_kernel, border)
+        interpolated = values / numpy.maximum(weights, 1e-6)
+        out[..., color] = numpy.where(mask[center] > 0, data[center],
+                                      interpolated)
+    return out
+
+
+def _malvar_tile(data, colors, border):
+    """Gradient corrected (Malvar-He-Cutler) demosaic of a padded Bayer tile.
+
+    Args:
+        data - The padded CFA samples of the tile as float32.
+        colors - The color (0, 1, or 2) of each sample in data.
+        border - The padding around the tile.
+    """
+    height = data.shape[0] - 2 * border
+    width = data.shape[1] - 2 * border
+    center = colors[border:border + height, border:border + width]
+    # The color of the pixel to the right tells red rows from blue rows.
+    right = colors[border:border + height, border + 1:border + width + 1]
+    samples = data[border:border + height, border:border + width]
+
+    green = _convolve(data, _malvar_green, border) / 8
+    in_row = _convolve(data, _malvar_row, border) / 8
+    in_column = _convolve(data, _malvar_column, border) / 8
+    diagonal = _convolve(data, _malvar_diagonal, border) / 8
+
+    is_green = center == 1
+    out = numpy.empty((height, width, 3), dtype=numpy.float32)
+    out[..., 1] = numpy.where(is_green, samples, green)
+    for color, other in ((0, 2), (2, 0)):
+        out[..., color] = numpy.select(
+            [center == color, center == other,
+             is_green & (right == color)],
+            [samples, diagonal, in_row],
+            in_column)
+    return out
+
+
+_methods = {
+    'bilinear': _bilinear_tile,
+    'malvar': _malvar_tile,
+}
+
+
+def _round(rgb, dtype):
+    """Round and clip float samples if they are going into an integer dtype.
+
+    Args:
+        rgb - A float32 array.
+        dtype - The numpy dtype the samples will be stored as.
+    """
+    if numpy.issubdtype(dtype, numpy.integer):
+        info = numpy.iinfo(dtype)
+        rgb = numpy.clip(numpy.rint(rgb), info.min, info.max)
+    return rgb
+
+
+def _is_bayer(cfa):
+    """Check if a CFA layout is a 2x2 Bayer pattern.
+
+    Args:
+        cfa - A ((rows, columns), pattern) CFA layout.
+    """
+    dims, pattern = cfa
+    return tuple(dims) == (2, 2) and sorted(pattern) == [0, 1, 1, 2] and \
+        (pattern[0] == pattern[3] or pattern[1] == pattern[2])
+
+
+def _color_map(cfa, y0, y1, x0, x1):
+    """Get the color of each pixel in a region of the sensor.
+
+    Args:
+        cfa - A ((rows, columns), pattern) CFA layout.
+        y0, y1, x0, x1 - The region.
+    """
+    (rows, columns), pattern = cfa
+    pattern = numpy.array(pattern, dtype=numpy.uint8).reshape(rows, columns)
+    ys = numpy.arange(y0, y1) % rows
+    xs = numpy.arange(x0, x1) % columns
+    return pattern[ys[:, None], xs[None, :]]
+
+
+def _demosaic_tile(data, out, cfa, method, tile):
+    """Demosaic one tile of a CFA image into the output image.
+
+    The tile is read with a border of its neighbors' pixels (mirrored at
+    the edges of the image), so tiles join up seamlessly.
+
+    Args:
+        data - The whole 2D CFA image.
+        out - The whole 3D output image.
+        cfa - A ((rows, columns), pattern) CFA layout.
+        method - The name of the demosaicing method.
+        tile - The (y0, y1, x0, x1) region of the tile.
+    """
+    y0, y1, x0, x1 = tile
+    border = borders[method]
+    height, width = data.shape
+    top, left = max(0, y0 - border), max(0, x0 - border)
+    bottom, right = min(height, y1 + border), min(width, x1 + border)
+    pad = ((border - (y0 - top), border - (bottom - y1)),
+           (border - (x0 - left), border - (right - x1)))
+
+    samples = numpy.pad(data[top:bottom, left:right].astype(numpy.float32),
+                        pad, mode='reflect')
+    colors = numpy.pad(_color_map(cfa, top, bottom, left, right), pad,
+                       mode='reflect')
+    rgb = _methods[method](samples, colors, border)
+
+    out[y0:y1, x0:x1] = _round(rgb, out.dtype)
+
+
+def _demosaic_shared_tile(tile):
+    """Demosaic a tile of the image shared by the parent process.
+
+    Args:
+        tile - The (y0, y1, x0, x1) region of the tile.
+    """
+    data, out, cfa, method = _shared['job']
+    _demosaic_tile(data, out, cfa, method, tile)
+
+
+def _tiles(height, width, tile_size):
+    return [(y, min(y + tile_size, height), x, min(x + tile_size, width))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)]
+
+
+def _shared_array(shape, dtype):
+    """Allocate a numpy array in anonymous shared memory.
+
+    Forked child processes see (and can write to) the same memory.
+
+    Args:
+        shape - The shape of the array.
+        dtype - The numpy dtype of the array.
+    """
+    dtype = numpy.dtype(dtype)
+    size = dtype.itemsize
+    for n in shape:
+        size *= n
+    buf = mmap.mmap(-1, max(1, size))
+    return numpy.frombuffer(buf, dtype=dtype, count=size // dtype.itemsize
+                            ).reshape(shape)
+
+
+def demosaic(data, cfa, method='bilinear', tile_size=512, processes=None,
+             dtype=None):
+    """Interpolate a CFA image to RGB.
+
+    The image is processed in tiles (with a few pixels of overlap), so the
+    memory used on top of the input and output is bounded by the tile size.
+
+    Args:
+        data - A 2D numpy array of decoded raw samples.
+        cfa - A ((rows, columns), pattern) CFA layout, as returned by
+              `Raw._get_cfa_pattern', with colors 0 = red, 1 = green and
+              2 = blue.
+        method - 'bilinear' (any pattern) or 'malvar' (2x2 Bayer patterns
+                 only), a gradient corrected linear filter with fewer color
+                 artifacts.
+        tile_size - The width and height of the tiles.
+        processes - The number of worker processes to spread tiles over, or
+                    None to do everything in this process. The input and
+                    output are shared with forked workers, not copied.
+        dtype - The dtype of the output, by default that of data. Integer
+                outputs are rounded and clipped.
+    """
+    _require_numpy()
+    if method not in _methods:
+        raise ValueError("Unknown demosaicing method {}".format(method))
+    (rows, columns), pattern = cfa
+    pattern = tuple(pattern)
+    if len(pattern) != rows * columns or not set(pattern) <= set([0, 1, 2]):
+        raise ValueError("Only RGB CFA patterns can be demosaiced")
+    if method == 'malvar' and not _is_bayer(cfa):
+        raise NotImplementedError("malvar only supports Bayer patterns")
+    if data.ndim != 2:
+        raise ValueError("CFA data must be a 2D array")
+    if dtype is None:
+        dtype = data.dtype
+    cfa = ((rows, columns), pattern)
+    height, width = data.shape
+    tiles = _tiles(height, width, tile_size)
+
+    if processes is None:
+        out = numpy.empty((height, width, 3), dtype=dtype)
+        for tile in tiles:
+            _demosaic_tile(data, out, cfa, method, tile)
+        return out
+
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError:  # pragma: no cover
+        # Python 2 always forks on platforms that can.
+        context = multiprocessing
+    except ValueError:  # pragma: no cover
+        raise NotImplementedError("Parallel demosaicing needs fork()")
+
+    shared = _shared_array(data.shape, data.dtype)
+    shared[...] = data
+    out = _shared_array((height, width, 3), dtype)
+    _shared['job'] = (shared, out, cfa, method)
+    pool = context.Pool(processes)
+    try:
+        for _ in pool.imap_unordered(_demosaic_shared_tile, tiles):
+            pass
+    finally:
+        pool.terminate()
+        pool.join()
+        _shared.clear()
+    return out
+
+
+def half_size(data, cfa, white_balance=None, dtype=None):
+    """Bin each 2x2 quad of a Bayer image into one RGB pixel.
+
+    Red and blue come straight from their samples and green is the mean of
+    the two green samples, so no interpolation is done at all. An odd last
+    row or column is dropped.
+
+    Args:
+        data - A 2D numpy array of decoded raw samples, starting on an even
+               sensor row and column.
+        cfa - A ((rows, columns), pattern) CFA layout of a Bayer pattern.
+        white_balance - Optional (red, green, blue) multipliers.
+        dtype - The dtype of the output, by default that of data. Integer
+                outputs are rounded and clipped.
+    """
+    _require_numpy()
+    if not _is_bayer(cfa):
+        raise NotImplementedError("Half size binning needs a Bayer pattern")
+    if data.ndim != 2:
+        raise ValueError("CFA data must be a 2D array")
+    if dtype is None:
+        dtype = data.dtype
+    height = data.shape[0] - data.shape[0] % 2
+    width = data.shape[1] - data.shape[1] % 2
+    pattern = tuple(cfa[1])
+    planes = [data[y:height:2, x:width:2] for y in (0, 1) for x in (0, 1)]
+    green = [planes[i] for i in range(4) if pattern[i] == 1]
+
+    out = numpy.empty((height // 2, width // 2, 3), dtype=numpy.float32)
+    out[..., 0] = planes[pattern.index(0)]
+    numpy.add(green[0], green[1], out=out[..., 1], dtype=numpy.float32)
+    out[..., 1] *= 0.5
+    out[..., 2] = planes[pattern.index(2)]
+    if white_balance is not None:
+        out *= numpy.array(white_balance, dtype=numpy.float32)
+    return _round(out, dtype).astype(dtype, copy=False)
+
+
+def iter_half_size(chunks, cfa, white_balance=None, dtype=None):
+    """Bin a stream of raw rows into half size RGB rows.
+
+    Chunks may have any number of rows; an odd row left over at the end of
+    one chunk is carried into the next.
+
+    Args:
+        chunks - An iterable of (first row, 2D numpy array) tuples, such as
+                 the one returned by `rawphoto.stats.iter_raw_rows'.
+        cfa - A ((rows, columns), pattern) CFA layout of a Bayer pattern.
+        white_balance - Optional (red, green, blue) multipliers.
+        dtype - The dtype of the output, by default that of the data.
+    """
+    carry = None
+    carry_first = None
+    for first, rows in chunks:
+        if carry is not None and carry_first + len(carry) == first:
+            rows = numpy.vstack([carry, rows])
+            first = carry_first
+        carry = None
+        if first % 2:
+            # Quads start on even rows.
+            rows = rows[1:]
+            first += 1
+        even = len(rows) - len(rows) % 2
+        if even:
+            yield first // 2, half_size(rows[:even], cfa, white_balance,
+                                        dtype)
+        if even < len(rows):
+            carry = rows[even:]
+            carry_first = first + even
+
+
+def render_half_size(raw, white_balance=None, rows=256, cfa=None,
+                     dtype=None):
+    """Render the raw data of a file at half size by binning CFA quads.
+
+    The raw data is streamed rows rows at a time, so the only large
+    allocation is the output, a quarter of the pixels of the sensor.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef) with uncompressed data.
+        white_balance - Optional (red, green, blue) multipliers.
+        rows - The number of rows of raw data to read at a time.
+        cfa - A ((rows, columns), pattern) tuple to use instead of the
+              cfa_repeat_pattern_dim and cfa_pattern_two tags.
+        dtype - The dtype of the output, by default that of the raw data.
+    """
+    _require_numpy()
+    image = raw._find_raw_image()
+    if image is None:
+        raise ValueError("No raw sensor data found")
+    if cfa is None:
+        cfa = raw._get_cfa_pattern(num=image.num, name=image.name)
+    if cfa is None:
+        raise ValueError("Raw data has no CFA pattern")
+    if rows % 2:
+        rows += 1
+
+    out = None
+    for first, half in iter_half_size(iter_raw_rows(raw, rows=rows), cfa,
+                                      white_balance, dtype):
+        if out is None:
+            out = numpy.empty((image.height // 2, image.width // 2, 3),
+                              dtype=half.dtype)
+        out[first:first + len(half)] = half
+    return out
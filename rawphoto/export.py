@@ -0,0 +1,328 @@
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from rawphoto import cr2
+from rawphoto import nef
+from rawphoto.raw import get_parser
+from rawphoto.tiff import exif_tags
+
+import binascii
+import csv
+import json
+import os
+
+# Tags which hold offsets to other structures or large opaque blobs rather
+# than metadata worth exporting.
+excluded_tags = ['exif', 'gps_data', 'makernote', 'makernote_safety',
+                 'canon_camera_info']
+
+
+def _schema(tag_tables=(exif_tags, cr2.tags, nef.tags)):
+    """Build the fixed list of metadata columns for the given tag tables.
+
+    Columns are ordered by tag id, and names shared by several tags (eg.
+    data_offset) only appear once. Tables may give the same tag id different
+    names (eg. makernote and interop tags), so every table's names are kept
+    rather than merging the tables by id.
+
+    Args:
+        tag_tables - An iterable of tag id to tag name mappings.
+    """
+    tags = []
+    for table in tag_tables:
+        tags.extend(table.items())
+    names = []
+    for _, name in sorted(tags, key=lambda tag: tag[0]):
+        if isinstance(name, str) and name not in excluded_tags and \
+                name not in names:
+            names.append(name)
+    return names
+
+
+# The columns written for every file, in order.
+columns = ['path', 'format', 'error'] + _schema()
+
+
+def _format_value(value):
+    """Convert a tag value to something that can be serialized as JSON.
+
+    Args:
+        value - A value returned by `Ifd.get_value'.
+    """
+    if isinstance(value, bytes):
+        return binascii.hexlify(value).decode('ascii')
+    if isinstance(value, tuple):
+        return [_format_value(v) for v in value]
+    return value
+
+
+def _read_row(path, columns=columns):
+    """Parse a raw file and return its metadata as a list of column values.
+
+    Files which can not be parsed get a row with only the path, format and
+    error columns filled in.
+
+    Args:
+        path - The path of the raw file to parse.
+        columns - The columns to fill in.
+    """
+    row = dict.fromkeys(columns)
+    row['path'] = path
+    ext = os.path.splitext(path)[1].upper()
+    row['format'] = ext.lstrip('.')
+
+    try:
+        with get_parser(path)(filename=path) as raw:
+            ifd = raw.ifds[0]
+            subifds = sorted(ifd.subifds, key=str)
+            ifds = [ifd] + [ifd.subifds[k] for k in subifds]
+            for ifd in ifds:
+                for name, entry in ifd.entries.items():
+                    if name in row and row[name] is None:
+                        row[name] = _format_value(ifd.get_value(entry))
+    except Exception as e:
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return [row[c] for c in columns]
+
+
+def iter_batches(paths, batch_size=1000, processes=None, columns=columns):
+    """Parse raw files and yield their metadata in column oriented batches.
+
+    Each batch is a dict from column name to a list of at most batch_size
+    values, so memory use is bounded no matter how many paths are given.
+    Paths are consumed lazily; with worker processes the next batch is
+    parsed while the current one is being consumed, so at most two batches
+    of rows exist at once.
+
+    Args:
+        paths - An iterable of raw file paths.
+        batch_size - The maximum number of rows in a batch.
+        processes - The number of worker processes to parse files with, or
+                    None to parse them in this process.
+        columns - The columns to export.
+    """
+    read_row = partial(_read_row, columns=columns)
+    if processes is None:
+        batch = []
+        for path in paths:
+            batch.append(read_row(path))
+            if len(batch) >= batch_size:
+                yield _to_columns(batch, columns)
+                batch = []
+        if batch:
+            yield _to_columns(batch, columns)
+        return
+
+    paths = iter(paths)
+    chunksize = max(1, batch_size // (4 * processes))
+    pool = Pool(processes)
+    try:
+        pending = pool.map_async(read_row, list(islice(paths, batch_size)),
+                                 chunksize)
+        while True:
+            batch = pending.get()
+            if not batch:
+                break
+            pending = pool.map_async(read_row,
+                                     list(islice(paths, batch_size)),
+                                     chunksize)
+            yield _to_columns(batch, columns)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _to_columns(rows, columns):
+    """Transpose a list of rows into a dict of columns.
+
+    Args:
+        rows - A list of rows, each a list of column values.
+        columns - The column names.
+    """
+    return dict(zip(columns, (list(c) for c in zip(*rows))))
+
+
+def _csv_value(value):
+    """Convert an exported value to a CSV field.
+
+    Args:
+        value - A value returned by `_format_value'.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ' '.join(str(v) for v in value)
+    return value
+
+
+def write_csv(paths, fileobj, batch_size=1000, processes=None,
+              columns=columns):
+    """Export the metadata of raw files as CSV.
+
+    A header row is written first. Multi-valued tags are written space
+    separated.
+
+    Args:
+        paths - An iterable of raw file paths.
+        fileobj - A file like object to write the CSV to.
+        batch_size - The number of files to buffer before writing.
+        processes - The number of worker processes to parse files with.
+        columns - The columns to export.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(columns)
+    for batch in iter_batches(paths, batch_size=batch_size,
+                              processes=processes, columns=columns):
+        writer.writerows(zip(*[[_csv_value(v) for v in batch[c]]
+                               for c in columns]))
+
+
+def write_json_lines(paths, fileobj, batch_size=1000, processes=None,
+                     columns=columns):
+    """Export the metadata of raw files as one JSON object per line.
+
+    Args:
+        paths - An iterable of raw file paths.
+        fileobj - A file like object to write the JSON lines to.
+        batch_size - The number of files to buffer before writing.
+        processes - The number of worker processes to parse files with.
+        columns - The columns to export.
+    """
+    for batch in iter_batches(paths, batch_size=batch_size,
+                              processes=processes, columns=columns):
+        lines = []
+        for row in zip(*[batch[c] for c in columns]):
+            lines.append(json.dumps(dict(zip(columns, row)),
+                                    sort_keys=True) + '\n')
+        fileobj.write(''.join(lines))
+
+
+def _value_kind(value):
+    """Classify an exported value for picking a Parquet column type.
+
+    Args:
+        value - A value returned by `_format_value'.
+    """
+    if isinstance(value, list):
+        kinds = set(_value_kind(v) for v in value)
+        if kinds <= set(['int']):
+            return 'int_list'
+        if kinds <= set(['int', 'float']):
+            return 'float_list'
+        return 'string_list'
+    if isinstance(value, bool):
+        return 'string'
+    if isinstance(value, int) or type(value).__name__ == 'long':
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'string'
+
+
+def _arrow_type(pyarrow, values):
+    """Pick the Arrow type of a column from a batch of its values.
+
+    Integers and floats get numeric columns and multi-valued numeric tags
+    get list columns (a tag with a single value in some files is stored as
+    a one element list). Anything else, including columns with no values,
+    is stored as strings.
+
+    Args:
+        pyarrow - The pyarrow module.
+        values - The values of the column in one batch.
+    """
+    kinds = set(_value_kind(v) for v in values if v is not None)
+    if not kinds or kinds == set(['string']):
+        return pyarrow.string()
+    if kinds == set(['int']):
+        return pyarrow.int64()
+    if kinds <= set(['int', 'float']):
+        return pyarrow.float64()
+    if kinds <= set(['int', 'int_list']):
+        return pyarrow.list_(pyarrow.int64())
+    if kinds <= set(['int', 'float', 'int_list', 'float_list']):
+        return pyarrow.list_(pyarrow.float64())
+    return pyarrow.string()
+
+
+def _arrow_value(pyarrow, value, arrow_type):
+    """Convert an exported value to fit a column of the given Arrow type.
+
+    Returns None for values which don't fit (eg. a string in a numeric
+    column).
+
+    Args:
+        pyarrow - The pyarrow module.
+        value - A value returned by `_format_value'.
+        arrow_type - The Arrow type of the column.
+    """
+    if value is None:
+        return None
+    kind = _value_kind(value)
+    if arrow_type == pyarrow.string():
+        return str(_csv_value(value))
+    if arrow_type == pyarrow.int64():
+        return value if kind == 'int' else None
+    if arrow_type == pyarrow.float64():
+        return float(value) if kind in ('int', 'float') else None
+    if kind in ('int', 'float'):
+        value = [value]
+    elif kind == 'float_list' and \
+            arrow_type.value_type == pyarrow.int64():
+        return None
+    elif kind == 'string_list':
+        return None
+    if arrow_type.value_type == pyarrow.float64():
+        return [float(v) for v in value]
+    return value
+
+
+def write_parquet(paths, filename, batch_size=1000, processes=None,
+                  columns=columns):
+    """Export the metadata of raw files as a Parquet file.
+
+    Requires pyarrow. Each batch is written as a row group. Integer and
+    float tags are stored as int64 and float64 columns, multi-valued numeric
+    tags as list columns, and everything else as strings.
+
+    A Parquet file has a single schema, so column types are picked from the
+    first batch; columns with no values in it are stored as strings, and
+    values in later batches which don't fit their column's type are stored
+    as null.
+
+    Args:
+        paths - An iterable of raw file paths.
+        filename - The path of the Parquet file to write.
+        batch_size - The number of files in each row group.
+        processes - The number of worker processes to parse files with.
+        columns - The columns to export.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow")
+
+    schema = None
+    writer = None
+    try:
+        for batch in iter_batches(paths, batch_size=batch_size,
+                                  processes=processes, columns=columns):
+            if schema is None:
+                schema = pyarrow.schema([
+                    (c, _arrow_type(pyarrow, batch[c])) for c in columns])
+                writer = pyarrow.parquet.ParquetWriter(filename, schema)
+            arrays = [
+                pyarrow.array([_arrow_value(pyarrow, v, field.type)
+                               for v in batch[field.name]], type=field.type)
+                for field in schema
+            ]
+            writer.write_table(pyarrow.Table.from_arrays(arrays,
+                                                         schema=schema))
+        if writer is None:
+            schema = pyarrow.schema([(c, pyarrow.string()) for c in columns])
+            writer = pyarrow.parquet.ParquetWriter(filename, schema)
+    finally:
+        if writer is not None:
+            writer.close()
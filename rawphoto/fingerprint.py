@@ -0,0 +1,133 @@
+from rawphoto.raw import _slice_strips
+
+import hashlib
+import mmap
+import struct
+
+# Size of the chunks the raw data is hashed in.
+chunk_size = 1 << 20
+
+
+def _raw_data_strips(raw):
+    """Find the (offset, length) strips of the raw sensor data in a file.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+    """
+    image = raw._find_raw_image()
+    if image is None:
+        raise ValueError("No raw sensor data found")
+    return raw._get_image_strips(num=image.num, name=image.name)
+
+
+def _open_map(fhandle):
+    """Memory map a file handle for reading, or return None if it can't be.
+
+    Args:
+        fhandle - A file like object.
+    """
+    try:
+        return mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        # BytesIO has no file descriptor, and empty files can't be mapped.
+        return None
+
+
+def _hash_ranges(raw, ranges, digest):
+    """Feed the bytes in a list of (offset, length) ranges to a hash.
+
+    The file is memory mapped when possible, otherwise it is read in chunks
+    of at most `chunk_size' bytes. The file position is preserved.
+
+    Args:
+        raw - A parsed Raw object.
+        ranges - A list of (offset, length) tuples.
+        digest - A hashlib hash object to update.
+    """
+    mapped = _open_map(raw.fhandle)
+    if mapped is not None:
+        try:
+            view = memoryview(mapped)
+        except TypeError:
+            # Python 2 mmaps don't support the new buffer protocol.
+            view = mapped
+        try:
+            for offset, length in ranges:
+                end = min(offset + length, len(mapped))
+                for start in range(offset, end, chunk_size):
+                    digest.update(view[start:min(start + chunk_size, end)])
+        finally:
+            del view
+            mapped.close()
+        return
+
+    pos = raw.tell()
+    try:
+        for offset, length in ranges:
+            raw.seek(offset)
+            while length > 0:
+                buf = raw.read(min(chunk_size, length))
+                if not buf:
+                    break
+                length -= len(buf)
+                digest.update(buf)
+    finally:
+        raw.seek(pos)
+
+
+def _sample_ranges(offset, length, blocks, block_size):
+    """Pick evenly spaced blocks covering the start and end of a range.
+
+    Args:
+        offset - The offset of the range.
+        length - The length of the range.
+        blocks - The number of blocks to pick.
+        block_size - The size of each block.
+    """
+    if blocks < 2 or length <= blocks * block_size:
+        return [(offset, length)]
+    step = (length - block_size) // (blocks - 1)
+    return [(offset + i * step, block_size) for i in range(blocks)]
+
+
+def fingerprint(raw, algorithm='sha1'):
+    """Hash the raw sensor data of a raw file.
+
+    Only the raw data (every strip of it) is hashed, so edits to the
+    metadata or the embedded previews do not change the fingerprint.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+        algorithm - The name of a hashlib algorithm.
+    """
+    strips = _raw_data_strips(raw)
+    digest = hashlib.new(algorithm)
+    digest.update(struct.pack('>Q', sum(length for _, length in strips)))
+    _hash_ranges(raw, strips, digest)
+    return digest.hexdigest()
+
+
+def sampled_fingerprint(raw, algorithm='sha1', blocks=8, block_size=1 << 16):
+    """Hash a few fixed position blocks of the raw sensor data.
+
+    This is a cheap first pass for duplicate detection: files with different
+    sampled fingerprints are different, files with the same one should be
+    compared with `fingerprint'. Sampled fingerprints are never equal to full
+    fingerprints.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+        algorithm - The name of a hashlib algorithm.
+        blocks - The number of blocks to hash.
+        block_size - The size of each block.
+    """
+    strips = _raw_data_strips(raw)
+    length = sum(length for _, length in strips)
+    digest = hashlib.new(algorithm)
+    digest.update(b'sampled')
+    digest.update(struct.pack('>QQQ', length, blocks, block_size))
+    ranges = []
+    for start, size in _sample_ranges(0, length, blocks, block_size):
+        ranges.extend(_slice_strips(strips, start, size))
+    _hash_ranges(raw, ranges, digest)
+    return digest.hexdigest()
@@ -0,0 +1,149 @@
+from collections import namedtuple
+from io import BytesIO
+
+import os
+import struct
+
+# Start of frame markers. 0xc4 (DHT), 0xc8 (JPG), and 0xcc (DAC) fall inside
+# the same range but are not frame headers.
+sof_markers = {
+    0xc0: 'baseline',
+    0xc1: 'extended_sequential',
+    0xc2: 'progressive',
+    0xc3: 'lossless',
+    0xc5: 'differential_sequential',
+    0xc6: 'differential_progressive',
+    0xc7: 'differential_lossless',
+    0xc9: 'extended_sequential_arithmetic',
+    0xca: 'progressive_arithmetic',
+    0xcb: 'lossless_arithmetic',
+    0xcd: 'differential_sequential_arithmetic',
+    0xce: 'differential_progressive_arithmetic',
+    0xcf: 'differential_lossless_arithmetic',
+}
+
+# Markers which are not followed by a length field.
+standalone_markers = set([0x01, 0xd0, 0xd1, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6,
+                          0xd7, 0xd8])
+
+SOI = 0xd8
+EOI = 0xd9
+SOS = 0xda
+DRI = 0xdd
+
+
+_JpegHeaderFields = namedtuple("JpegHeaderFields", [
+    "process", "precision", "height", "width", "components", "sampling",
+    "restart_interval"
+])
+
+
+class JpegHeader(_JpegHeaderFields):
+    """Frame information for a JPEG, read without decoding the image.
+
+    Only the marker segments up to the start of scan are read; everything
+    else (EXIF blobs, tables, the entropy coded data) is skipped over.
+    """
+    __slots__ = ()
+
+    def __new__(cls, file=None, blob=None, offset=None, length=None,
+                rewind=True):
+        if sum([i is not None for i in [file, blob]]) > 1:
+            raise TypeError("JpegHeader must only specify one input")
+
+        if file is not None:
+            fhandle = file
+        elif blob is not None:
+            fhandle = BytesIO(blob)
+        else:
+            raise TypeError("JpegHeader must specify at least one input")
+
+        pos = fhandle.tell()
+        if offset is not None:
+            fhandle.seek(offset)
+        start = fhandle.tell()
+        end = start + length if length is not None else None
+
+        try:
+            fields = _read_frame(fhandle, end)
+        finally:
+            # Rewind the file...
+            if rewind:
+                fhandle.seek(pos)
+
+        return super(JpegHeader, cls).__new__(cls, *fields)
+
+
+def _read_marker(fhandle, end):
+    """Read the next marker and its segment length from a JPEG stream.
+
+    Args:
+        fhandle - A file like object positioned at a marker
+        end - The offset past which nothing may be read (or None)
+    """
+    buf = fhandle.read(2)
+    if len(buf) < 2 or buf[0:1] != b'\xff':
+        raise ValueError("Invalid JPEG marker")
+    [marker] = struct.unpack('>B', buf[1:2])
+    # Any number of 0xff fill bytes may precede a marker.
+    while marker == 0xff:
+        if end is not None and fhandle.tell() >= end:
+            raise ValueError("JPEG marker runs past the end of the image")
+        buf = fhandle.read(1)
+        if len(buf) < 1:
+            raise ValueError("Truncated JPEG marker")
+        [marker] = struct.unpack('>B', buf)
+    if marker in standalone_markers or marker == EOI:
+        return marker, 0
+    buf = fhandle.read(2)
+    if len(buf) < 2:
+        raise ValueError("Truncated JPEG segment")
+    [seg_len] = struct.unpack('>H', buf)
+    if seg_len < 2:
+        raise ValueError("Invalid JPEG segment length")
+    if end is not None and fhandle.tell() + seg_len - 2 > end:
+        raise ValueError("JPEG segment runs past the end of the image")
+    return marker, seg_len - 2
+
+
+def _read_frame(fhandle, end):
+    """Walk JPEG marker segments until the start of scan.
+
+    Args:
+        fhandle - A file like object positioned at the SOI marker
+        end - The offset past which nothing may be read (or None)
+    """
+    marker, _ = _read_marker(fhandle, end)
+    if marker != SOI:
+        raise ValueError("JPEG data must start with an SOI marker")
+
+    frame = None
+    restart_interval = 0
+    while True:
+        marker, seg_len = _read_marker(fhandle, end)
+        if marker in (SOS, EOI):
+            break
+        if marker in sof_markers:
+            buf = fhandle.read(seg_len)
+            if len(buf) < 6:
+                raise ValueError("Truncated JPEG frame header")
+            precision, height, width, components = struct.unpack_from(
+                '>BHHB', buf)
+            if len(buf) < 6 + 3 * components:
+                raise ValueError("Truncated JPEG frame header")
+            sampling = tuple(
+                struct.unpack_from('>B', buf, 7 + 3 * i)[0]
+                for i in range(components))
+            frame = (sof_markers[marker], precision, height, width,
+                     components, sampling)
+        elif marker == DRI:
+            buf = fhandle.read(seg_len)
+            if seg_len != 2 or len(buf) < 2:
+                raise ValueError("Invalid JPEG restart interval segment")
+            [restart_interval] = struct.unpack('>H', buf)
+        else:
+            fhandle.seek(seg_len, os.SEEK_CUR)
+
+    if frame is None:
+        raise ValueError("No start of frame marker found in JPEG data")
+    return frame + (restart_interval,)
@@ -17,8 +17,10 @@ subdirs = [0x8769, 0x014a]
 
 class Nef(Raw):
 
-    def __init__(self, blob=None, file=None, filename=None):
-        super(Nef, self).__init__(blob=blob, file=file, filename=filename)
+    def __init__(self, blob=None, file=None, filename=None, pool=None,
+                 source=None):
+        super(Nef, self).__init__(blob=blob, file=file, filename=filename,
+                                  pool=pool, source=source)
 
         pos = self.tell()
         self.header = Header(self.read(8))
@@ -40,6 +42,11 @@ class Nef(Raw):
         """Read a preview image from the NEF as a JPEG."""
         return self._get_image_data(name='preview_image')
 
+    @property
+    def preview_image_header(self):
+        """Probe the size of the preview JPEG without reading it."""
+        return self._get_image_header(name='preview_image')
+
     @property
     def thumbnail_image(self):
         raise NotImplementedError("NEF's do not contain a thumbnail image")
@@ -0,0 +1,219 @@
+from collections import namedtuple
+from rawphoto.raw import get_parser
+
+import binascii
+import json
+import os
+import struct
+
+# Tag types whose values can't be written; rationals are read as their
+# numerator only, so there is nothing to round trip.
+unsupported_tag_types = [0x5, 0xA]
+
+_WriteFields = namedtuple("WriteFields", ["offset", "data"])
+
+
+class Write(_WriteFields):
+    """Bytes to be written at an offset in a file."""
+    __slots__ = ()
+
+
+def _encode_value(endianness, entry, value):
+    """Pack a new value for an IFD entry using the entry's tag type.
+
+    Returns the value count and the packed bytes.
+
+    Args:
+        endianness - The struct endianness flag of the file.
+        entry - The IfdEntry being patched.
+        value - The new value (a string, bytes, number, or tuple of numbers).
+    """
+    if entry.tag_type_key in unsupported_tag_types:
+        raise TypeError("Patching rational values is not supported")
+    if entry.tag_type == 's':
+        if not isinstance(value, bytes):
+            value = value.encode("utf-8")
+        if entry.tag_type_key == 0x02 and not value.endswith(b'\0'):
+            value += b'\0'
+        return len(value), value
+    if not isinstance(value, (tuple, list)):
+        value = (value,)
+    return len(value), struct.pack('{}{}{}'.format(
+        endianness, len(value), entry.tag_type), *value)
+
+
+def _is_inline(entry, count):
+    """Check if a value of count elements fits in an IFD entry.
+
+    Strings are always stored at an offset, however short, since that is how
+    they are read back. Sizes are the standard TIFF ones, not native ones.
+
+    Args:
+        entry - The IfdEntry being patched.
+        count - The number of values.
+    """
+    if entry.tag_type == 's':
+        return False
+    return struct.calcsize('<' + entry.tag_type) * count <= 4
+
+
+def plan_patch(raw, values):
+    """Work out the writes needed to set tag values in a parsed raw file.
+
+    Every IFD (and sub-IFD) holding a tag is patched. Values that fit where
+    the old value lives are overwritten in place; larger values are appended
+    to the end of the file and the entry is pointed at them.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+        values - A dict from tag name to new value.
+    """
+    pos = raw.tell()
+    raw.seek(0, os.SEEK_END)
+    end = raw.tell()
+    raw.seek(pos)
+
+    ifds = []
+    for ifd in raw.ifds:
+        ifds.append(ifd)
+        ifds.extend(ifd.subifds[k] for k in sorted(ifd.subifds, key=str))
+
+    writes = []
+    for tag_name in sorted(values, key=str):
+        found = False
+        for ifd in ifds:
+            if tag_name not in ifd.entries:
+                continue
+            found = True
+            entry = ifd.entries[tag_name]
+            entry_offset = ifd.entry_offsets[tag_name]
+            count, data = _encode_value(ifd.endianness, entry,
+                                        values[tag_name])
+            count_data = struct.pack(ifd.endianness + 'L', count)
+
+            if _is_inline(entry, count):
+                writes.append(Write(entry_offset + 4, count_data +
+                                    data.ljust(4, b'\0')))
+            elif not _is_inline(entry, entry.value_len) and len(data) <= \
+                    struct.calcsize('<' + entry.tag_type) * entry.value_len:
+                writes.append(Write(entry.raw_value, data))
+                if count != entry.value_len:
+                    writes.append(Write(entry_offset + 4, count_data))
+            else:
+                # Values must start on a word boundary.
+                end += end % 2
+                writes.append(Write(end, data))
+                writes.append(Write(entry_offset + 4, count_data +
+                                    struct.pack(ifd.endianness + 'L', end)))
+                end += len(data)
+        if not found:
+            raise KeyError(tag_name)
+    return writes
+
+
+def _apply_writes(fhandle, writes):
+    """Write a list of Writes to a file and flush it to disk.
+
+    Args:
+        fhandle - A file opened for updating in binary mode.
+        writes - A list of Writes.
+    """
+    for write in writes:
+        fhandle.seek(0, os.SEEK_END)
+        if write.offset > fhandle.tell():
+            fhandle.write(b'\0' * (write.offset - fhandle.tell()))
+        fhandle.seek(write.offset)
+        fhandle.write(write.data)
+    fhandle.flush()
+    os.fsync(fhandle.fileno())
+
+
+def patch_file(filename, values):
+    """Set tag values in a raw file without rewriting it.
+
+    Args:
+        filename - The path of the raw file.
+        values - A dict from tag name to new value.
+    """
+    with get_parser(filename)(filename=filename) as raw:
+        writes = plan_patch(raw, values)
+    with open(filename, "r+b") as fhandle:
+        _apply_writes(fhandle, writes)
+
+
+def _write_journal(journal, entries):
+    """Atomically write a journal file and flush it to disk.
+
+    Args:
+        journal - The path of the journal.
+        entries - The JSON serializable journal contents.
+    """
+    tmp = journal + '.tmp'
+    with open(tmp, "w") as fhandle:
+        json.dump(entries, fhandle)
+        fhandle.flush()
+        os.fsync(fhandle.fileno())
+    os.rename(tmp, journal)
+
+
+def patch_files(patches, journal):
+    """Set tag values in many raw files, recoverably.
+
+    All writes are planned first, and the bytes they overwrite (along with
+    the original size of each file) are saved to a journal before anything
+    is changed. If the process dies part way through, `recover' puts every
+    file back the way it was. The journal is removed once all files have
+    been patched.
+
+    Args:
+        patches - An iterable of (filename, values) tuples, where values is
+                  a dict from tag name to new value.
+        journal - The path of the journal file to use.
+    """
+    if os.path.exists(journal):
+        raise IOError("Journal {} exists; run recover first".format(journal))
+
+    planned = []
+    entries = []
+    for filename, values in patches:
+        with get_parser(filename)(filename=filename) as raw:
+            writes = plan_patch(raw, values)
+            raw.seek(0, os.SEEK_END)
+            size = raw.tell()
+            originals = []
+            for write in writes:
+                raw.seek(write.offset)
+                originals.append([write.offset, binascii.hexlify(
+                    raw.read(len(write.data))).decode('ascii')])
+        planned.append((filename, writes))
+        entries.append({'filename': filename, 'size': size,
+                        'originals': originals})
+
+    _write_journal(journal, entries)
+    for filename, writes in planned:
+        with open(filename, "r+b") as fhandle:
+            _apply_writes(fhandle, writes)
+    os.remove(journal)
+
+
+def recover(journal):
+    """Undo an interrupted `patch_files' using its journal.
+
+    Does nothing if the journal does not exist.
+
+    Args:
+        journal - The path of the journal file.
+    """
+    if not os.path.exists(journal):
+        return
+    with open(journal) as fhandle:
+        entries = json.load(fhandle)
+    for entry in entries:
+        with open(entry['filename'], "r+b") as fhandle:
+            for offset, data in entry['originals']:
+                fhandle.seek(offset)
+                fhandle.write(binascii.unhexlify(data))
+            fhandle.truncate(entry['size'])
+            fhandle.flush()
+            os.fsync(fhandle.fileno())
+    os.remove(journal)
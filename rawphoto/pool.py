@@ -0,0 +1,190 @@
+from collections import namedtuple
+from collections import OrderedDict
+from threading import Lock
+
+import os
+
+_PoolStatsFields = namedtuple("PoolStatsFields", [
+    "hits", "misses", "reopens", "open_handles"
+])
+
+
+class PoolStats(_PoolStatsFields):
+    __slots__ = ()
+
+    @property
+    def hit_rate(self):
+        """The fraction of reads that found their file already open."""
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return float(self.hits) / total
+
+
+class HandlePool(object):
+    """A bounded, least recently used pool of open file handles.
+
+    Files are opened on demand and the least recently used handle is closed
+    when more than `size' files are open, so any number of `PooledFile'
+    objects can be kept alive without running out of file descriptors.
+    """
+
+    def __init__(self, size=64):
+        if size < 1:
+            raise ValueError("HandlePool size must be at least 1")
+        self.size = size
+        self._handles = OrderedDict()
+        self._evicted = set()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reopens = 0
+
+    def _acquire(self, filename):
+        """Get an open handle for a file, opening it if necessary.
+
+        Must be called with the pool lock held.
+
+        Args:
+            filename - The path of the file to open.
+        """
+        fhandle = self._handles.pop(filename, None)
+        if fhandle is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if filename in self._evicted:
+                self._evicted.discard(filename)
+                self.reopens += 1
+            fhandle = open(filename, "rb")
+            while len(self._handles) >= self.size:
+                evicted, old = self._handles.popitem(last=False)
+                self._evicted.add(evicted)
+                old.close()
+        # Reinsert the handle as the most recently used one.
+        self._handles[filename] = fhandle
+        return fhandle
+
+    def read_at(self, filename, offset, size=-1):
+        """Read bytes from a file at an offset.
+
+        Args:
+            filename - The path of the file to read.
+            offset - The offset to read at.
+            size - The number of bytes to read, or -1 to read to the end.
+        """
+        with self._lock:
+            fhandle = self._acquire(filename)
+            fhandle.seek(offset)
+            return fhandle.read(size)
+
+    def fileno(self, filename):
+        """Get a file descriptor for a file.
+
+        The descriptor is only valid until the file is evicted from the pool.
+
+        Args:
+            filename - The path of the file.
+        """
+        with self._lock:
+            return self._acquire(filename).fileno()
+
+    def discard(self, filename):
+        """Close a file's handle if it is open.
+
+        Args:
+            filename - The path of the file.
+        """
+        with self._lock:
+            fhandle = self._handles.pop(filename, None)
+            self._evicted.discard(filename)
+        if fhandle is not None:
+            fhandle.close()
+
+    def close(self):
+        """Close every open handle in the pool."""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._evicted.clear()
+        for fhandle in handles:
+            fhandle.close()
+
+    @property
+    def stats(self):
+        """Get the hit, miss, and reopen counts of the pool."""
+        with self._lock:
+            return PoolStats(self.hits, self.misses, self.reopens,
+                             len(self._handles))
+
+
+class PooledFile(object):
+    """A read only file like object whose handle lives in a HandlePool.
+
+    The position is tracked here, so the underlying handle may be closed and
+    reopened by the pool between any two reads.
+    """
+
+    def __init__(self, filename, pool):
+        self.name = filename
+        self.pool = pool
+        self.closed = False
+        self._pos = 0
+        # Fail early (like open) if the file can't be read.
+        pool.read_at(filename, 0, 0)
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def read(self, size=-1):
+        """Read at most size bytes from the current position.
+
+        Args:
+            size - The number of bytes to read, or -1 to read to the end.
+        """
+        self._check_closed()
+        if size is None:
+            size = -1
+        buf = self.pool.read_at(self.name, self._pos, size)
+        self._pos += len(buf)
+        return buf
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Change the current position.
+
+        Args:
+            offset - The offset to seek to, relative to whence.
+            whence - os.SEEK_SET, os.SEEK_CUR, or os.SEEK_END.
+        """
+        self._check_closed()
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += os.path.getsize(self.name)
+        elif whence != os.SEEK_SET:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if offset < 0:
+            raise ValueError("Negative seek position {}".format(offset))
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        """Get the current position."""
+        self._check_closed()
+        return self._pos
+
+    def fileno(self):
+        """Get a file descriptor, valid until the pool evicts the file."""
+        self._check_closed()
+        return self.pool.fileno(self.name)
+
+    def close(self):
+        """Close the file. The pooled handle is left for other users."""
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
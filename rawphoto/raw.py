@@ -1,9 +1,121 @@
+import importlib
 import os
 
+from collections import namedtuple
 from io import BytesIO
+from rawphoto.jpeg import JpegHeader
+from rawphoto.pool import PooledFile
+from rawphoto.source import BlockCache
 
 raw_formats = ['.CR2']
 
+# Mapping from file extension to the module and class used to parse it. The
+# classes are imported on demand since their modules import this one.
+parsers = {
+    '.CR2': ('rawphoto.cr2', 'Cr2'),
+    '.NEF': ('rawphoto.nef', 'Nef'),
+}
+
+# Compression values for JPEG data (old style and new style JPEG).
+jpeg_compression = [6, 7]
+
+# Strips closer together than this are read with a single call.
+coalesce_gap = 64 * 1024
+
+# The most buffers to pass to a single os.preadv call.
+max_buffers = 1024
+
+# Photometric interpretation for color filter array (raw sensor) data.
+cfa_photometric = 32803
+
+_EmbeddedImageFields = namedtuple("EmbeddedImageFields", [
+    "num", "name", "width", "height", "compression", "length", "is_raw"
+])
+
+
+class EmbeddedImage(_EmbeddedImageFields):
+    """Description of an image stored in an IFD or sub-IFD of a raw file.
+
+    `num' and `name' are the arguments that select the image in
+    `Raw._get_image_data'. `is_raw' is set for sensor data (a CFA image or a
+    lossless JPEG) which can not be displayed as is.
+    """
+    __slots__ = ()
+
+
+def _coalesce(strips, gap=None):
+    """Groups strips that are close together in a file into larger reads.
+
+    Yields (offset, length, parts) for each read, where parts is a list of
+    (start, length) pieces making up the read in file order. start is the
+    position of a strip in the output buffer (strips are laid out in the
+    order given), or None for a gap between strips that is read and thrown
+    away.
+
+    Args:
+        strips - A list of (offset, length) tuples.
+        gap - The largest gap between strips to read through.
+    """
+    if gap is None:
+        gap = coalesce_gap
+
+    starts = []
+    start = 0
+    for offset, length in strips:
+        starts.append(start)
+        start += length
+    order = sorted(range(len(strips)), key=lambda i: strips[i][0])
+
+    run = None
+    for i in order:
+        offset, length = strips[i]
+        if run is not None:
+            end = run[0] + run[1]
+            if 0 <= offset - end <= gap and len(run[2]) + 2 <= max_buffers:
+                if offset > end:
+                    run[2].append((None, offset - end))
+                run[2].append((starts[i], length))
+                run[1] = offset + length - run[0]
+                continue
+            yield tuple(run)
+        run = [offset, length, [(starts[i], length)]]
+    if run is not None:
+        yield tuple(run)
+
+
+def _slice_strips(strips, start, length):
+    """Maps a byte range of the concatenated strips to ranges in the file.
+
+    Args:
+        strips - A list of (offset, length) tuples.
+        start - The start of the range within the concatenated strips.
+        length - The length of the range.
+    """
+    ranges = []
+    for offset, size in strips:
+        if length <= 0:
+            break
+        if start < size:
+            take = min(size - start, length)
+            ranges.append((offset + start, take))
+            length -= take
+            start = 0
+        else:
+            start -= size
+    return ranges
+
+
+def get_parser(filename):
+    """Get the Raw subclass used to parse a file from its extension.
+
+    Raises KeyError if the extension is not a supported raw format.
+
+    Args:
+        filename - The path of the raw file.
+    """
+    module, name = parsers[os.path.splitext(filename)[1].upper()]
+    return getattr(importlib.import_module(module), name)
+
 
 def discover(path):
     """recursively search for raw files in a given directory"""
@@ -20,17 +132,35 @@ def discover(path):
 
 class Raw(object):
 
-    def __init__(self, blob=None, file=None, filename=None):
+    def __init__(self, blob=None, file=None, filename=None, pool=None,
+                 source=None):
+        """Open a raw file.
+
+        Args:
+            blob - The bytes of the raw file.
+            file - A file like object to read the raw file from.
+            filename - The path of the raw file.
+            pool - A HandlePool to keep the handle for filename in, instead
+                   of holding the file open for the life of this object.
+            source - A RangeSource (eg. an HttpSource) to read the raw file
+                     from through a BlockCache.
+        """
 
-        if sum([i is not None for i in [file, blob, filename]]) > 1:
+        if sum([i is not None for i in [file, blob, filename, source]]) > 1:
             raise TypeError("Raw must specify only one input")
+        if pool is not None and filename is None:
+            raise TypeError("Raw can only pool handles for a filename")
 
         if file is not None:
             self.fhandle = file
         elif blob is not None:
             self.fhandle = BytesIO(blob)
+        elif filename is not None and pool is not None:
+            self.fhandle = PooledFile(filename, pool)
         elif filename is not None:
             self.fhandle = open(filename, "rb")
+        elif source is not None:
+            self.fhandle = BlockCache(source)
         else:
             raise TypeError("Raw must specify at least one input")
 
@@ -70,23 +200,297 @@ class Raw(object):
         except AttributeError:
             return "@"
 
-    def _get_image_data(self, num=0, name=None):
-        """Gets image data from an IFD or sub-IFD.
+    def _get_image_ifd(self, num=0, name=None):
+        """Gets the IFD or sub-IFD holding an image.
 
         Args:
             name - The sub IFD name to read an image from.
             num - The IFD number to read an image from.
         """
-
         if name is not None:
-            entries = self.ifds[0].subifds[name].entries
-        else:
-            entries = self.ifds[num].entries
+            return self.ifds[0].subifds[name]
+        return self.ifds[num]
+
+    def _get_image_entries(self, num=0, name=None):
+        """Gets the entries of the IFD or sub-IFD holding an image.
+
+        Args:
+            name - The sub IFD name to read an image from.
+            num - The IFD number to read an image from.
+        """
+        return self._get_image_ifd(num=num, name=name).entries
+
+    def _get_image_strips(self, num=0, name=None):
+        """Gets the (offset, length) of each strip of an image in an IFD.
+
+        Most embedded images are a single strip, but strip based TIFF
+        layouts store an array of offsets and lengths. Returns None if the IFD
+        does not contain an image.
+
+        Args:
+            name - The sub IFD name to read an image from.
+            num - The IFD number to read an image from.
+        """
+
+        ifd = self._get_image_ifd(num=num, name=name)
+        entries = ifd.entries
         if 'data_offset' in entries and 'data_length' in entries:
+            offsets = ifd.get_value(entries['data_offset'])
+            lengths = ifd.get_value(entries['data_length'])
+            if not isinstance(offsets, tuple):
+                offsets = (offsets,)
+            if not isinstance(lengths, tuple):
+                lengths = (lengths,)
+            return list(zip(offsets, lengths))
+        else:
+            return None
+
+    def _read_strips(self, strips):
+        """Reads a list of (offset, length) strips into one buffer.
+
+        Strips that are close together in the file are read with a single
+        call, scattered straight into the output buffer with os.preadv when
+        the file has a descriptor and the platform supports it.
+
+        Args:
+            strips - A list of (offset, length) tuples.
+        """
+
+        # Range based sources fetch all of the strips at once up front, in
+        # the runs they will be read in.
+        prefetch = getattr(self.fhandle, 'prefetch', None)
+        if prefetch is not None:
+            prefetch([(offset, length)
+                      for offset, length, _ in _coalesce(strips)])
+
+        if len(strips) == 1:
+            offset, length = strips[0]
             pos = self.tell()
-            self.seek(entries['data_offset'].raw_value)
-            img_data = self.read(entries['data_length'].raw_value)
+            self.seek(offset)
+            data = self.read(length)
             self.seek(pos)
-            return img_data
+            return data
+
+        buf = bytearray(sum(length for _, length in strips))
+        view = memoryview(buf)
+        fd = None
+        if hasattr(os, 'preadv'):
+            try:
+                fd = self.fhandle.fileno()
+            except (AttributeError, EnvironmentError, ValueError):
+                fd = None
+
+        pos = self.tell()
+        try:
+            for run_offset, run_length, parts in _coalesce(strips):
+                if fd is not None:
+                    buffers = [view[start:start + length] if start is not None
+                               else bytearray(length)
+                               for start, length in parts]
+                    if os.preadv(fd, buffers, run_offset) < run_length:
+                        raise IOError("Unexpected end of file reading strips")
+                    continue
+
+                self.seek(run_offset)
+                data = self.read(run_length)
+                if len(data) < run_length:
+                    raise IOError("Unexpected end of file reading strips")
+                src = 0
+                for start, length in parts:
+                    if start is not None:
+                        view[start:start + length] = data[src:src + length]
+                    src += length
+        finally:
+            self.seek(pos)
+        return bytes(buf)
+
+    def _get_image_data(self, num=0, name=None):
+        """Gets image data from an IFD or sub-IFD.
+
+        Args:
+            name - The sub IFD name to read an image from.
+            num - The IFD number to read an image from.
+        """
+
+        strips = self._get_image_strips(num=num, name=name)
+        if strips is not None:
+            return self._read_strips(strips)
+        else:
+            return None
+
+    def _get_image_rows(self, start, stop, num=0, name=None):
+        """Gets the strips of a strip based image covering a range of rows.
+
+        Only the strips holding rows start to stop - 1 are read. Returns the
+        first row in the returned data (which is always a whole number of
+        strips) and the data itself, or None if the IFD has no image.
+
+        Args:
+            start - The first row to read.
+            stop - The row to stop reading before.
+            name - The sub IFD name to read an image from.
+            num - The IFD number to read an image from.
+        """
+
+        strips = self._get_image_strips(num=num, name=name)
+        if strips is None:
+            return None
+        ifd = self._get_image_ifd(num=num, name=name)
+        if 'row_per_strip' in ifd.entries:
+            rows_per_strip = ifd.get_value(ifd.entries['row_per_strip'])
         else:
+            # Without the tag, the whole image is a single strip.
+            rows_per_strip = None
+        if not rows_per_strip:
+            return 0, self._read_strips(strips)
+
+        first = max(0, start) // rows_per_strip
+        last = max(first + 1, -(-stop // rows_per_strip))
+        return (first * rows_per_strip,
+                self._read_strips(strips[first:last]))
+
+    def _get_image_header(self, num=0, name=None):
+        """Probes the JPEG markers of an embedded image without reading it.
+
+        Only the marker segments up to the start of scan are read, so this is
+        much cheaper than reading the image data and decoding it.
+
+        Args:
+            name - The sub IFD name to read an image from.
+            num - The IFD number to read an image from.
+        """
+
+        strips = self._get_image_strips(num=num, name=name)
+        if strips is not None:
+            offset, length = strips[0]
+            return JpegHeader(file=self.fhandle, offset=offset, length=length)
+        else:
+            return None
+
+    def _describe_image(self, num=0, name=None):
+        """Describes an embedded image without reading its data.
+
+        JPEG images are sized by probing their frame header, anything else
+        by the image_width and image_height tags of its IFD.
+
+        Args:
+            name - The sub IFD name to describe an image from.
+            num - The IFD number to describe an image from.
+        """
+
+        strips = self._get_image_strips(num=num, name=name)
+        if strips is None:
+            return None
+        ifd = self._get_image_ifd(num=num, name=name)
+        entries = ifd.entries
+
+        def value(tag_name):
+            if tag_name in entries:
+                return ifd.get_value(entries[tag_name])
+            return None
+
+        compression = value('compression')
+        is_raw = value('photometric_interpretation') == cfa_photometric
+        width = value('image_width')
+        height = value('image_height')
+        if compression is None or compression in jpeg_compression:
+            try:
+                header = self._get_image_header(num=num, name=name)
+            except ValueError:
+                header = None
+            if header is not None:
+                width = header.width
+                height = header.height
+                is_raw = is_raw or header.process == 'lossless'
+
+        return EmbeddedImage(num, name, width, height, compression,
+                             sum(length for _, length in strips), is_raw)
+
+    @property
+    def embedded_images(self):
+        """Lists every image embedded in the file with its size.
+
+        Only headers are read; use `_get_image_data' (or `get_image') with the
+        `num' and `name' of an entry to read the image itself.
+        """
+        images = []
+        for num in range(len(self.ifds)):
+            image = self._describe_image(num=num)
+            if image is not None:
+                images.append(image)
+        for name in sorted(self.ifds[0].subifds, key=str):
+            image = self._describe_image(name=name)
+            if image is not None:
+                images.append(image)
+        return images
+
+    def _get_cfa_pattern(self, num=0, name=None):
+        """Gets the color filter array layout of a raw image.
+
+        Returns the (rows, columns) of the repeating pattern and a tuple of
+        the color at each position, in row major order (0 = red, 1 = green,
+        2 = blue), or None if the IFD does not describe its CFA.
+
+        Args:
+            name - The sub IFD name of the raw image.
+            num - The IFD number of the raw image.
+        """
+
+        ifd = self._get_image_ifd(num=num, name=name)
+        entries = ifd.entries
+        if 'cfa_repeat_pattern_dim' not in entries or \
+                'cfa_pattern_two' not in entries:
+            return None
+        dims = tuple(ifd.get_value(entries['cfa_repeat_pattern_dim']))
+        pattern = ifd.get_value(entries['cfa_pattern_two'])
+        if isinstance(pattern, bytes):
+            pattern = tuple(bytearray(pattern))
+        elif not isinstance(pattern, tuple):
+            pattern = (pattern,)
+        if len(dims) != 2 or dims[0] * dims[1] != len(pattern):
+            raise ValueError("CFA pattern does not match its dimensions")
+        return dims, pattern
+
+    def _find_raw_image(self):
+        """Finds the embedded image holding the raw sensor data.
+
+        Returns None if the file has no raw data.
+        """
+        for image in self.embedded_images:
+            if image.is_raw:
+                return image
+        return None
+
+    def find_image(self, width=0, height=0):
+        """Finds the smallest displayable image of at least width x height.
+
+        Raw sensor data and images of unknown size are never chosen. Returns
+        None if no embedded image is large enough.
+
+        Args:
+            width - The minimum width of the image.
+            height - The minimum height of the image.
+        """
+        candidates = [
+            i for i in self.embedded_images
+            if not i.is_raw and i.width is not None and
+            i.height is not None and i.width >= width and i.height >= height
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda i: (i.width * i.height, i.length))
+
+    def get_image(self, width=0, height=0):
+        """Reads the smallest displayable image of at least width x height.
+
+        Only the chosen image is read. Returns None if no embedded image is
+        large enough.
+
+        Args:
+            width - The minimum width of the image.
+            height - The minimum height of the image.
+        """
+        image = self.find_image(width=width, height=height)
+        if image is None:
             return None
+        return self._get_image_data(num=image.num, name=image.name)
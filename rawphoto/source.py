@@ -0,0 +1,370 @@
+from collections import namedtuple
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+import mmap
+import os
+import re
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import Request
+    from urllib.request import urlopen
+except ImportError:  # pragma: no cover
+    from urllib2 import HTTPError
+    from urllib2 import Request
+    from urllib2 import urlopen
+
+
+class RangeSource(object):
+    """Random access to the bytes of a raw file, one range at a time.
+
+    Subclasses implement `read_range' and `size'; wrap a source in a
+    `BlockCache' (or pass it to `Raw' as source) to read it like a file.
+    """
+
+    def read_range(self, offset, length):
+        """Read up to length bytes starting at offset.
+
+        Must be safe to call from several threads at once.
+
+        Args:
+            offset - The offset to read from.
+            length - The number of bytes to read.
+        """
+        raise NotImplementedError()
+
+    @property
+    def size(self):
+        """The size of the file in bytes."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Release any resources held by the source."""
+        pass
+
+
+class FileSource(RangeSource):
+    """A local file, read with positioned reads."""
+
+    def __init__(self, filename):
+        self.name = filename
+        self.fhandle = open(filename, "rb")
+        self._lock = Lock()
+
+    def read_range(self, offset, length):
+        if hasattr(os, 'pread'):
+            return os.pread(self.fhandle.fileno(), length, offset)
+        with self._lock:  # pragma: no cover
+            self.fhandle.seek(offset)
+            return self.fhandle.read(length)
+
+    @property
+    def size(self):
+        return os.fstat(self.fhandle.fileno()).st_size
+
+    def close(self):
+        self.fhandle.close()
+
+
+class MmapSource(RangeSource):
+    """A local file, read through a memory map."""
+
+    def __init__(self, filename):
+        self.name = filename
+        with open(filename, "rb") as fhandle:
+            self._map = mmap.mmap(fhandle.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def read_range(self, offset, length):
+        return self._map[offset:offset + length]
+
+    @property
+    def size(self):
+        return len(self._map)
+
+    def close(self):
+        self._map.close()
+
+
+class HttpSource(RangeSource):
+    """A file served over HTTP, read with range requests."""
+
+    def __init__(self, url, timeout=30):
+        self.name = url
+        self.url = url
+        self.timeout = timeout
+        self._size = None
+
+    def read_range(self, offset, length):
+        if length <= 0:
+            return b''
+        request = Request(self.url, headers={
+            'Range': 'bytes={}-{}'.format(offset, offset + length - 1)
+        })
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 416:
+                # Range not satisfiable: reading past the end of the file.
+                return b''
+            raise
+        try:
+            status = response.getcode()
+            if status != 206:
+                raise IOError("Server ignored range request for {} ({})"
+                              .format(self.url, status))
+            match = re.match(r'bytes \d+-\d+/(\d+)',
+                             response.info().get('Content-Range', ''))
+            if match is not None:
+                self._size = int(match.group(1))
+            return response.read()
+        finally:
+            response.close()
+
+    @property
+    def size(self):
+        if self._size is None:
+            request = Request(self.url)
+            request.get_method = lambda: 'HEAD'
+            response = urlopen(request, timeout=self.timeout)
+            try:
+                self._size = int(response.info().get('Content-Length'))
+            finally:
+                response.close()
+        return self._size
+
+
+_CacheStatsFields = namedtuple("CacheStatsFields", [
+    "hits", "misses", "requests", "bytes_fetched"
+])
+
+
+class CacheStats(_CacheStatsFields):
+    __slots__ = ()
+
+
+class BlockCache(object):
+    """A read only file like object over a RangeSource.
+
+    Reads are served from an LRU cache of fixed size blocks. Missing blocks
+    that are next to each other are fetched with a single range request,
+    and `prefetch' fetches several ranges concurrently. Reads too large to
+    cache are split into chunks which are fetched concurrently and not
+    cached.
+    """
+
+    def __init__(self, source, block_size=64 * 1024, max_blocks=256,
+                 threads=4):
+        self.source = source
+        self.name = getattr(source, 'name', None)
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.threads = threads
+        self.closed = False
+        self._blocks = OrderedDict()
+        self._pool = None
+        self._pos = 0
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    @property
+    def stats(self):
+        """Get the block hit and miss counts and the requests made."""
+        return CacheStats(self.hits, self.misses, self.requests,
+                          self.bytes_fetched)
+
+    def _map(self, function, items):
+        """Call function on each item, concurrently if there are several.
+
+        Args:
+            function - The function to call.
+            items - A list of arguments.
+        """
+        if len(items) < 2 or self.threads < 2:
+            return [function(i) for i in items]
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+        return self._pool.map(function, items)
+
+    def _fetch(self, run):
+        """Read an (offset, length) range from the source.
+
+        Args:
+            run - The (offset, length) range.
+        """
+        return self.source.read_range(*run)
+
+    def _fetch_runs(self, runs):
+        """Fetch ranges from the source, concurrently.
+
+        Args:
+            runs - A list of (offset, length) ranges.
+        """
+        results = self._map(self._fetch, runs)
+        self.requests += len(runs)
+        self.bytes_fetched += sum(len(r) for r in results)
+        return results
+
+    def _missing_runs(self, blocks):
+        """Group the uncached blocks of a sorted list of blocks into runs.
+
+        Args:
+            blocks - A sorted iterable of block indices.
+        """
+        runs = []
+        for block in blocks:
+            if block in self._blocks:
+                continue
+            if runs and runs[-1][0] + runs[-1][1] == block:
+                runs[-1][1] += 1
+            else:
+                runs.append([block, 1])
+        return runs
+
+    def _load(self, block_runs):
+        """Fetch runs of blocks and add them to the cache.
+
+        Args:
+            block_runs - A list of [first block, block count] runs.
+        """
+        bs = self.block_size
+        results = self._fetch_runs([(b * bs, n * bs) for b, n in block_runs])
+        for (first, count), data in zip(block_runs, results):
+            self.misses += count
+            for i in range(count):
+                chunk = data[i * bs:(i + 1) * bs]
+                if not chunk:
+                    break
+                self._blocks[first + i] = chunk
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def _is_large(self, length):
+        return length > self.block_size * self.max_blocks // 2
+
+    def prefetch(self, ranges):
+        """Fetch the blocks covering several (offset, length) ranges.
+
+        Runs of missing blocks are fetched concurrently. Ranges too large to
+        cache are left for `read' to fetch, and nothing past the first
+        max_blocks blocks is fetched, since it would only evict blocks
+        fetched for earlier ranges before they are read.
+
+        Args:
+            ranges - A list of (offset, length) tuples, in the order they
+                     will be read.
+        """
+        self._check_closed()
+        blocks = set()
+        for offset, length in ranges:
+            if length <= 0 or self._is_large(length):
+                continue
+            for block in range(offset // self.block_size,
+                               (offset + length - 1) // self.block_size + 1):
+                if len(blocks) >= self.max_blocks:
+                    break
+                blocks.add(block)
+        for block in sorted(blocks):
+            if block in self._blocks:
+                # Keep wanted blocks from being evicted by the ones loaded.
+                self._blocks[block] = self._blocks.pop(block)
+        runs = self._missing_runs(sorted(blocks))
+        if runs:
+            self._load(runs)
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def read(self, size=-1):
+        """Read at most size bytes from the current position.
+
+        Args:
+            size - The number of bytes to read, or -1 to read to the end.
+        """
+        self._check_closed()
+        if size is None or size < 0:
+            size = max(0, self.source.size - self._pos)
+        if size == 0:
+            return b''
+        start = self._pos
+
+        if self._is_large(size):
+            chunk = self.block_size * 16
+            runs = [(offset, min(chunk, start + size - offset))
+                    for offset in range(start, start + size, chunk)]
+            data = b''.join(self._fetch_runs(runs))
+            self._pos += len(data)
+            return data
+
+        bs = self.block_size
+        first = start // bs
+        last = (start + size - 1) // bs
+        runs = self._missing_runs(range(first, last + 1))
+        self.hits += last - first + 1 - sum(n for _, n in runs)
+        if runs:
+            self._load(runs)
+
+        pieces = []
+        for block in range(first, last + 1):
+            data = self._blocks.get(block)
+            if data is None:
+                # Past the end of the file (or evicted by this very read).
+                data = self.source.read_range(block * bs, bs)
+                self.requests += 1
+                self.bytes_fetched += len(data)
+            else:
+                # Mark the block as recently used.
+                self._blocks[block] = self._blocks.pop(block)
+            pieces.append(data)
+            if len(data) < bs:
+                break
+        data = b''.join(pieces)[start - first * bs:start - first * bs + size]
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Change the current position.
+
+        Args:
+            offset - The offset to seek to, relative to whence.
+            whence - os.SEEK_SET, os.SEEK_CUR, or os.SEEK_END.
+        """
+        self._check_closed()
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.source.size
+        elif whence != os.SEEK_SET:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if offset < 0:
+            raise ValueError("Negative seek position {}".format(offset))
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        """Get the current position."""
+        self._check_closed()
+        return self._pos
+
+    def close(self):
+        """Close the cache, its worker threads, and the source."""
+        if self.closed:
+            return
+        self.closed = True
+        self._blocks.clear()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
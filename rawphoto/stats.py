@@ -0,0 +1,272 @@
+from multiprocessing import Pool
+from rawphoto.pool import PooledFile
+from rawphoto.raw import _slice_strips
+
+import os
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Names of the colors used in CFA patterns.
+cfa_colors = {
+    0: 'R',
+    1: 'G',
+    2: 'B',
+    3: 'C',
+    4: 'M',
+    5: 'Y',
+    6: 'W',
+}
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("Raw sensor statistics require numpy")
+
+
+def _raw_layout(raw):
+    """Work out where the raw sensor data is and how to decode it.
+
+    Returns the raw EmbeddedImage, its strips, and the numpy dtype of a
+    sample.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+    """
+    image = raw._find_raw_image()
+    if image is None:
+        raise ValueError("No raw sensor data found")
+    if image.compression not in (None, 1):
+        raise NotImplementedError("Compressed raw data is not supported")
+    if image.width is None or image.height is None:
+        raise ValueError("Raw data has no image_width or image_height")
+
+    ifd = raw._get_image_ifd(num=image.num, name=image.name)
+    bits = 16
+    if 'bits_per_sample' in ifd.entries:
+        bits = ifd.get_value(ifd.entries['bits_per_sample'])
+    if bits == 8:
+        dtype = numpy.dtype('u1')
+    elif bits == 16:
+        endianness = raw.endianness if raw.endianness in '<>' else '='
+        dtype = numpy.dtype(endianness + 'u2')
+    else:
+        raise NotImplementedError(
+            "Packed {} bit raw data is not supported".format(bits))
+
+    strips = raw._get_image_strips(num=image.num, name=image.name)
+    return image, strips, dtype
+
+
+def iter_raw_rows(raw, rows=256, start=0, stop=None):
+    """Yield the uncompressed raw sensor data a few rows at a time.
+
+    Each item is the index of the first row and a 2D numpy array of at most
+    rows rows. Only the bytes for those rows are read, so memory use does not
+    depend on the size of the sensor.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef).
+        rows - The number of rows to read at a time.
+        start - The first row to read.
+        stop - The row to stop reading before, or None to read to the end.
+    """
+    _require_numpy()
+    image, strips, dtype = _raw_layout(raw)
+    stride = image.width * dtype.itemsize
+    if stop is None or stop > image.height:
+        stop = image.height
+
+    for first in range(start, stop, rows):
+        count = min(rows, stop - first)
+        ranges = _slice_strips(strips, first * stride, count * stride)
+        data = raw._read_strips(ranges)
+        if len(data) < count * stride:
+            raise IOError("Unexpected end of file reading raw data")
+        yield first, numpy.frombuffer(data, dtype=dtype).reshape(
+            count, image.width)
+
+
+class CfaStatistics(object):
+    """Per CFA channel statistics, accumulated from strips of raw data.
+
+    Everything is derived from one histogram per position in the CFA
+    pattern, so memory use is constant and statistics from different strips
+    (or different processes) can simply be added together.
+    """
+
+    def __init__(self, pattern_dim=(2, 2), pattern=(0, 1, 1, 2), bits=16):
+        _require_numpy()
+        self.pattern_dim = tuple(pattern_dim)
+        self.pattern = tuple(pattern)
+        self.levels = 1 << bits
+        self.histograms = numpy.zeros((len(self.pattern), self.levels),
+                                      dtype=numpy.int64)
+
+    @property
+    def channels(self):
+        """The color name of each CFA position, eg. ['R', 'G', 'G', 'B']."""
+        return [cfa_colors.get(c, str(c)) for c in self.pattern]
+
+    def update(self, rows, first_row=0):
+        """Add a strip of raw data to the statistics.
+
+        Args:
+            rows - A 2D numpy array of raw samples.
+            first_row - The row of the sensor that the strip starts on.
+        """
+        height, width = self.pattern_dim
+        for y in range(height):
+            for x in range(width):
+                samples = rows[(y - first_row) % height::height, x::width]
+                counts = numpy.bincount(samples.ravel(),
+                                        minlength=self.levels)
+                if len(counts) > self.levels:
+                    # Fold out of range samples into the top level.
+                    counts[self.levels - 1] += counts[self.levels:].sum()
+                    counts = counts[:self.levels]
+                self.histograms[y * width + x] += counts
+
+    def merge(self, other):
+        """Add the statistics of another CfaStatistics to these.
+
+        Args:
+            other - A CfaStatistics with the same pattern and levels.
+        """
+        self.histograms += other.histograms
+        return self
+
+    @property
+    def counts(self):
+        """The number of samples of each channel."""
+        return self.histograms.sum(axis=1)
+
+    @property
+    def means(self):
+        """The mean value of each channel."""
+        totals = self.histograms.dot(numpy.arange(self.levels,
+                                                  dtype=numpy.float64))
+        return totals / numpy.maximum(self.counts, 1)
+
+    @property
+    def minimums(self):
+        """The smallest value of each channel (its observed black level)."""
+        return numpy.array([numpy.flatnonzero(h)[0] if h.any() else 0
+                            for h in self.histograms])
+
+    @property
+    def maximums(self):
+        """The largest value of each channel (its observed white level)."""
+        return numpy.array([numpy.flatnonzero(h)[-1] if h.any() else 0
+                            for h in self.histograms])
+
+    def percentiles(self, percent):
+        """The value below which percent of each channel's samples fall.
+
+        Args:
+            percent - A percentage between 0 and 100.
+        """
+        cumulative = self.histograms.cumsum(axis=1)
+        targets = self.counts * (percent / 100.0)
+        return numpy.array([numpy.searchsorted(c, t)
+                            for c, t in zip(cumulative, targets)])
+
+    def clipped(self, white_level):
+        """The number of samples of each channel at or above white_level.
+
+        Args:
+            white_level - The sensor's clipping level. This is usually well
+                          below the largest value that can be stored (12 and
+                          14 bit data is stored in 16 bit words), so it must
+                          be given; `maximums' is a reasonable estimate for
+                          an image known to be clipped.
+        """
+        return self.histograms[:, white_level:].sum(axis=1)
+
+
+def _local_filename(raw):
+    """Get the path a raw was opened from, if workers can reopen it.
+
+    Returns None unless the raw is read from a local file (directly or
+    through a HandlePool); a name alone (eg. the URL of an HttpSource) is
+    not enough.
+
+    Args:
+        raw - A parsed Raw object.
+    """
+    fhandle = raw.fhandle
+    filename = getattr(fhandle, 'name', None)
+    if not isinstance(filename, str):
+        return None
+    if isinstance(fhandle, PooledFile):
+        return filename
+    if hasattr(fhandle, 'fileno') and os.path.isfile(filename):
+        return filename
+    return None
+
+
+def _strip_statistics(args):
+    """Accumulate statistics over a range of rows of a raw file.
+
+    Runs in a worker process, so the file is opened again by name.
+
+    Args:
+        args - A (parser, filename, start, stop, rows, pattern_dim, pattern,
+               bits) tuple.
+    """
+    parser, filename, start, stop, rows, pattern_dim, pattern, bits = args
+    stats = CfaStatistics(pattern_dim, pattern, bits)
+    with parser(filename=filename) as raw:
+        for first, data in iter_raw_rows(raw, rows=rows, start=start,
+                                         stop=stop):
+            stats.update(data, first)
+    return stats.histograms
+
+
+def sensor_statistics(raw, rows=256, processes=None, cfa=None):
+    """Compute per CFA channel statistics over the raw data of a file.
+
+    The raw data is read rows rows at a time, so peak memory is roughly
+    constant regardless of the size of the sensor.
+
+    Args:
+        raw - A parsed Raw object (eg. a Cr2 or Nef) with uncompressed data.
+        rows - The number of rows to process at a time.
+        processes - The number of worker processes to spread strips over, or
+                    None to do everything in this process. Workers reopen
+                    the file, so it must have been opened by filename.
+        cfa - A ((rows, columns), pattern) tuple to use instead of the
+              cfa_repeat_pattern_dim and cfa_pattern_two tags.
+    """
+    _require_numpy()
+    image, _, dtype = _raw_layout(raw)
+    if cfa is None:
+        cfa = raw._get_cfa_pattern(num=image.num, name=image.name)
+    if cfa is None:
+        raise ValueError("Raw data has no CFA pattern")
+    pattern_dim, pattern = cfa
+    bits = dtype.itemsize * 8
+    stats = CfaStatistics(pattern_dim, pattern, bits)
+
+    if processes is None:
+        for first, data in iter_raw_rows(raw, rows=rows):
+            stats.update(data, first)
+        return stats
+
+    filename = _local_filename(raw)
+    if filename is None:
+        raise TypeError("Parallel statistics need a raw opened by filename")
+    step = rows * max(1, -(-image.height // (rows * processes * 4)))
+    tasks = [(type(raw), filename, start, min(start + step, image.height),
+              rows, pattern_dim, pattern, bits)
+             for start in range(0, image.height, step)]
+    pool = Pool(processes)
+    try:
+        for histograms in pool.imap_unordered(_strip_statistics, tasks):
+            stats.histograms += histograms
+    finally:
+        pool.terminate()
+        pool.join()
+    return stats
@@ -1,9 +1,16 @@
+from array import array
+from bisect import bisect_left
 from collections import namedtuple
 from io import BytesIO
 
 import os
 import struct
 
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
 exif_tags = {
     0x0001: 'interop_index',
     0x0002: 'interop_version',
@@ -141,7 +148,7 @@ class IfdEntry(_IfdEntryFields):
         else:
             tag_name = tag_id
         tag_type = tag_types[tag_type_key]
-        size = struct.calcsize(tag_type) * value_len
+        size = struct.calcsize('<' + tag_type) * value_len
         if size > 4 or tag_type == 's':
             # If the value is a pointer to something small:
             [raw_value] = _read_tag(endianness + 'L', fhandle)
@@ -164,6 +171,150 @@ class IfdEntry(_IfdEntryFields):
                                             tag_type_key, value_len, raw_value)
 
 
+# Reverse mappings from tag name to tag ids, shared by every IfdEntries
+# parsed with the same tag table. Keyed by the id of the table (which is kept
+# alive alongside its index).
+_tag_indexes = {}
+
+
+def _tag_index(tags):
+    """Get a mapping from tag name to the tag ids with that name.
+
+    Args:
+        tags - A tag id to tag name mapping.
+    """
+    cached = _tag_indexes.get(id(tags))
+    if cached is not None and cached[0] is tags:
+        return cached[1]
+    index = {}
+    for tag_id, tag_name in tags.items():
+        index.setdefault(tag_name, []).append(tag_id)
+    _tag_indexes[id(tags)] = (tags, index)
+    return index
+
+
+class IfdEntries(Mapping):
+    """A compact, read only mapping from tag name to IfdEntry.
+
+    Entries are stored as parallel typed arrays of tag id, tag type, value
+    count, the raw 4 byte value field, and position in the IFD, sorted by
+    tag id. Names are resolved through the (shared) tag table, and IfdEntry
+    tuples are only built when an entry is looked up. As with a dict, when
+    several entries have the same name the last one in the IFD wins.
+    """
+    __slots__ = ('endianness', 'tags', 'tag_types', 'table_offset',
+                 'tag_ids', 'tag_type_keys', 'value_lens', 'raw_values',
+                 'positions')
+
+    def __init__(self, endianness, table, table_offset=0, tags=exif_tags,
+                 tag_types=tag_types):
+        """Parse a table of IFD entries.
+
+        Args:
+            endianness - The struct endianness flag of the file.
+            table - The bytes of the entries (12 per entry).
+            table_offset - The file offset of the table.
+            tags - A tag id to tag name mapping.
+            tag_types - A tag type to struct format mapping.
+        """
+        self.endianness = endianness
+        self.tags = tags
+        self.tag_types = tag_types
+        self.table_offset = table_offset
+
+        rows = {}
+        fmt = endianness + 'HHLL'
+        for position in range(len(table) // 12):
+            row = struct.unpack_from(fmt, table, 12 * position)
+            if row[1] not in tag_types:
+                raise KeyError(row[1])
+            rows[tags.get(row[0], row[0])] = row + (position,)
+        if len(table) % 12:
+            raise struct.error("Truncated IFD entry")
+
+        rows = sorted(rows.values())
+        self.tag_ids = array('H', [r[0] for r in rows])
+        self.tag_type_keys = array('B', [r[1] for r in rows])
+        self.value_lens = array('I', [r[2] for r in rows])
+        self.raw_values = array('I', [r[3] for r in rows])
+        self.positions = array('H', [r[4] for r in rows])
+
+    def _find(self, name):
+        """Get the array index of the entry with a given name, or -1.
+
+        Args:
+            name - A tag name (or tag id for tags not in the tag table).
+        """
+        tag_ids = _tag_index(self.tags).get(name)
+        if tag_ids is None:
+            if isinstance(name, int) and name not in self.tags:
+                tag_ids = [name]
+            else:
+                return -1
+        found = -1
+        for tag_id in tag_ids:
+            i = bisect_left(self.tag_ids, tag_id)
+            if i < len(self.tag_ids) and self.tag_ids[i] == tag_id and \
+                    (found < 0 or self.positions[i] > self.positions[found]):
+                found = i
+        return found
+
+    def _entry(self, i):
+        """Build the IfdEntry for an array index.
+
+        Args:
+            i - The index of the entry in the arrays.
+        """
+        tag_id = self.tag_ids[i]
+        tag_type_key = self.tag_type_keys[i]
+        tag_type = self.tag_types[tag_type_key]
+        value_len = self.value_lens[i]
+        raw_value = self.raw_values[i]
+        size = struct.calcsize('<' + tag_type) * value_len
+        if size <= 4 and tag_type != 's':
+            # The value is stored in the entry; reinterpret its bytes.
+            buf = struct.pack(self.endianness + 'L', raw_value)
+            if value_len > 1:
+                raw_value = struct.unpack_from('{}{}{}'.format(
+                    self.endianness, value_len, tag_type), buf)
+            else:
+                [raw_value] = struct.unpack_from(self.endianness + tag_type,
+                                                 buf)
+        return IfdEntry._make((tag_id, self.tags.get(tag_id, tag_id),
+                               tag_type, tag_type_key, value_len, raw_value))
+
+    def offset(self, name):
+        """Get the file offset of the entry with a given name.
+
+        Args:
+            name - A tag name.
+        """
+        i = self._find(name)
+        if i < 0:
+            raise KeyError(name)
+        return self.table_offset + 12 * self.positions[i]
+
+    def __getitem__(self, name):
+        i = self._find(name)
+        if i < 0:
+            raise KeyError(name)
+        return self._entry(i)
+
+    def __contains__(self, name):
+        try:
+            return self._find(name) >= 0
+        except TypeError:
+            # Unhashable names are never present.
+            return False
+
+    def __iter__(self):
+        for tag_id in self.tag_ids:
+            yield self.tags.get(tag_id, tag_id)
+
+    def __len__(self):
+        return len(self.tag_ids)
+
+
 class Ifd(object):
 
     def __init__(self, endianness, file=None, blob=None, offset=None,
@@ -189,31 +340,37 @@ class Ifd(object):
         self.endianness = endianness
         [num_entries] = _read_tag(endianness + 'H', self.fhandle)
 
-        self.entries = {}
-        self.subifds = {}
-        for i in range(num_entries):
-            e = IfdEntry(endianness, file=self.fhandle,
-                         tags=tags, rewind=False)
-            self.entries[e.tag_name] = e
+        table_offset = self.fhandle.tell()
+        table = self.fhandle.read(12 * num_entries)
+        self.entries = IfdEntries(endianness, table, table_offset, tags=tags,
+                                  tag_types=tag_types)
+        subifd_offsets = []
+        for e in self.entries.values():
             if e.tag_id in subdirs:
                 if e.value_len > 1:
-                    i = 0
-                    for o in self.get_value(e):
-                        self.subifds[e.tag_name[i]] = Ifd(endianness,
-                                                          file=self.fhandle,
-                                                          offset=o, tags=tags,
-                                                          subdirs=subdirs)
-                        i += 1
-
+                    subifd_offsets.extend(zip(e.tag_name, self.get_value(e)))
                 else:
-                    self.subifds[e.tag_name] = Ifd(endianness,
-                                                   file=self.fhandle,
-                                                   offset=e.raw_value,
-                                                   tags=tags,
-                                                   subdirs=subdirs)
+                    subifd_offsets.append((e.tag_name, e.raw_value))
+
+        # Range based sources can fetch every sub-IFD at once rather than
+        # one request at a time as they are parsed.
+        prefetch = getattr(self.fhandle, 'prefetch', None)
+        if prefetch is not None and len(subifd_offsets) > 1:
+            prefetch([(o, 2) for _, o in subifd_offsets])
+
+        self.subifds = {}
+        for name, o in subifd_offsets:
+            self.subifds[name] = Ifd(endianness, file=self.fhandle, offset=o,
+                                     tags=tags, subdirs=subdirs)
         [self.next_ifd_offset] = _read_tag(endianness + 'H', self.fhandle)
         self.fhandle.seek(pos)
 
+    @property
+    def entry_offsets(self):
+        """A dict from tag name to the file offset of the entry."""
+        return dict((name, self.entries.offset(name))
+                    for name in self.entries)
+
     def get_value(self, entry):
         """Get the value of an entry in the IFD.
 
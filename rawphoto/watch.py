@@ -0,0 +1,221 @@
+from rawphoto.raw import get_parser
+from rawphoto.raw import parsers
+
+import os
+import struct
+import time
+
+
+class Watcher(object):
+    """Incrementally watch a directory tree for new or changed raw files.
+
+    Each `poll' only lists directories whose mtime has changed since the
+    last one, and only stats files that are waiting to settle, so a rescan
+    costs time proportional to what changed rather than to the size of the
+    tree. Files modified in place (without touching their directory) are
+    only noticed by a `poll(full=True)'.
+
+    A file is ready once its size and mtime have not changed for `settle'
+    seconds, so files still being written are never parsed. Ready files are
+    held back until no new files have turned up for `debounce' seconds (or
+    the oldest has waited `max_delay' seconds), so a burst of captures is
+    handed out together.
+    """
+
+    def __init__(self, path, settle=1.0, debounce=0.5, max_delay=5.0,
+                 include_existing=False, clock=time.time):
+        self.path = path
+        self.settle = settle
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.clock = clock
+        self.errors = {}
+        self._dirs = {}
+        self._files = {}
+        self._pending = {}
+        self._ready = {}
+        self._last_candidate = None
+        self._scan_dir(path, self.clock(), include_existing)
+
+    def _is_raw(self, filename):
+        return os.path.splitext(filename)[1].upper() in parsers
+
+    def _scan_dir(self, path, now, candidates=True):
+        """List a directory, recording new files and recursing into new
+        subdirectories.
+
+        Args:
+            path - The directory to list.
+            now - The current time.
+            candidates - Whether new files should be considered for output
+                         (rather than just recorded as already seen).
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+            names = os.listdir(path)
+        except OSError:
+            self._forget_dir(path)
+            return
+
+        # Only names that weren't there last time are stat'ed, so relisting
+        # a big directory costs one stat per new entry, not per entry.
+        old = self._dirs.get(path)
+        old_files, old_dirs, old_others = \
+            old[1:] if old else (set(), set(), set())
+        children = set(os.path.join(path, name) for name in names)
+        files = old_files & children
+        dirs = old_dirs & children
+        others = old_others & children
+        for child in children - old_files - old_dirs - old_others:
+            if os.path.isdir(child):
+                dirs.add(child)
+            elif self._is_raw(child):
+                files.add(child)
+            else:
+                others.add(child)
+        self._dirs[path] = (mtime, files, dirs, others)
+
+        for child in files - old_files:
+            if candidates:
+                self._add_candidate(child, now)
+            else:
+                try:
+                    st = os.stat(child)
+                except OSError:
+                    continue
+                self._files[child] = (st.st_mtime, st.st_size)
+        for child in old_files - files:
+            self._files.pop(child, None)
+            self._pending.pop(child, None)
+            self._ready.pop(child, None)
+        for child in dirs - old_dirs:
+            self._scan_dir(child, now, candidates)
+        for child in old_dirs - dirs:
+            self._forget_dir(child)
+
+    def _forget_dir(self, path):
+        """Drop a directory (and everything below it) from the snapshot.
+
+        Args:
+            path - The directory that has gone away.
+        """
+        old = self._dirs.pop(path, None)
+        if old is None:
+            return
+        for child in old[1]:
+            self._files.pop(child, None)
+            self._pending.pop(child, None)
+            self._ready.pop(child, None)
+        for child in old[2]:
+            self._forget_dir(child)
+
+    def _add_candidate(self, path, now):
+        """Start waiting for a new or changed file to settle.
+
+        Args:
+            path - The path of the file.
+            now - The current time.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._pending[path] = (st.st_mtime, st.st_size, now)
+        self._ready.pop(path, None)
+        self._last_candidate = now
+
+    def _check_pending(self, now):
+        """Move pending files that have stopped changing to the ready set.
+
+        Args:
+            now - The current time.
+        """
+        for path, (mtime, size, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                self._pending[path] = (st.st_mtime, st.st_size, now)
+                self._last_candidate = now
+            elif now - since >= self.settle:
+                del self._pending[path]
+                self._files[path] = (mtime, size)
+                self._ready[path] = now
+
+    def poll(self, full=False):
+        """Rescan the tree and return the paths of files that are ready.
+
+        Args:
+            full - Stat every known file to catch files modified in place.
+        """
+        now = self.clock()
+        for path in list(self._dirs):
+            if path not in self._dirs:
+                # Removed while scanning a parent.
+                continue
+            mtime = self._dirs[path][0]
+            try:
+                changed = os.stat(path).st_mtime != mtime
+            except OSError:
+                changed = True
+            # A directory changed in the same clock tick as the last listing
+            # may not show it in its mtime, so list recent ones again.
+            if changed or now - mtime < self.settle:
+                self._scan_dir(path, now)
+
+        if full:
+            for path, old in list(self._files.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if (st.st_mtime, st.st_size) != old:
+                    del self._files[path]
+                    self._add_candidate(path, now)
+
+        self._check_pending(now)
+        if not self._ready:
+            return []
+        quiet = self._last_candidate is None or \
+            now - self._last_candidate >= self.debounce
+        if not quiet and now - min(self._ready.values()) < self.max_delay:
+            return []
+        ready = sorted(self._ready)
+        self._ready.clear()
+        return ready
+
+    def parse(self, paths):
+        """Parse ready files, yielding (path, raw) for each one that parses.
+
+        Files that can't be parsed are recorded in `errors'. The caller is
+        responsible for closing the yielded Raw objects.
+
+        Args:
+            paths - Paths returned by `poll'.
+        """
+        for path in paths:
+            try:
+                raw = get_parser(path)(filename=path)
+            except (EnvironmentError, IndexError, KeyError, ValueError,
+                    struct.error) as e:
+                self.errors[path] = e
+                continue
+            self.errors.pop(path, None)
+            yield path, raw
+
+    def watch(self, interval=1.0, full_every=None):
+        """Poll forever, yielding (path, raw) for each new or changed file.
+
+        Args:
+            interval - The number of seconds to sleep between polls.
+            full_every - Do a full poll every this many polls (or never).
+        """
+        polls = 0
+        while True:
+            polls += 1
+            full = full_every is not None and polls % full_every == 0
+            for item in self.parse(self.poll(full=full)):
+                yield item
+            time.sleep(interval)
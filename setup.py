@@ -8,6 +8,10 @@ setup(
     author_email='sam@samwhited.com',
     url='https://github.com/photoshell/rawphoto',
     packages=['rawphoto'],
+    extras_require={
+        'numpy': ['numpy'],
+        'parquet': ['pyarrow'],
+    },
     keywords=['encoding', 'images', 'photography'],
     classifiers=[
         "Programming Language :: Python",
@@ -0,0 +1,179 @@
+from rawphoto import demosaic
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+bayer_patterns = [(0, 1, 1, 2), (1, 0, 2, 1), (2, 1, 1, 0), (1, 2, 0, 1)]
+
+
+def _mosaic(rgb, pattern, dims=(2, 2)):
+    """Sample an RGB image through a CFA."""
+    height, width, _ = rgb.shape
+    colors = demosaic._color_map((dims, pattern), 0, height, 0, width)
+    return numpy.take_along_axis(rgb, colors[..., None].astype(int),
+                                 axis=2)[..., 0]
+
+
+def _flat(height=7, width=9, color=(100, 200, 50)):
+    return numpy.tile(numpy.array(color, dtype=numpy.uint16),
+                      (height, width, 1))
+
+
+@pytest.mark.parametrize("method", ["bilinear", "malvar"])
+@pytest.mark.parametrize("pattern", bayer_patterns)
+def test_flat_color_is_reconstructed(method, pattern):
+    rgb = _flat()
+    out = demosaic.demosaic(_mosaic(rgb, pattern), ((2, 2), pattern),
+                            method=method)
+    assert out.dtype == numpy.uint16
+    assert (out == rgb).all()
+
+
+def test_bilinear_other_patterns():
+    # A 3x3 pattern containing every color in each row and column.
+    pattern = (0, 1, 2, 1, 2, 0, 2, 0, 1)
+    rgb = _flat(12, 12)
+    data = _mosaic(rgb, pattern, dims=(3, 3))
+    assert (demosaic.demosaic(data, ((3, 3), pattern)) == rgb).all()
+
+
+@pytest.mark.parametrize("method", ["bilinear", "malvar"])
+def test_linear_gradient_interior(method):
+    ys, xs = numpy.mgrid[0:16, 0:16].astype(numpy.float32)
+    rgb = numpy.dstack([10 * xs + 3 * ys, 5 * xs + 7 * ys + 50,
+                        2 * xs + ys + 100])
+    data = _mosaic(rgb, (0, 1, 1, 2))
+    out = demosaic.demosaic(data, ((2, 2), (0, 1, 1, 2)), method=method)
+    assert out.dtype == numpy.float32
+    assert numpy.allclose(out[2:-2, 2:-2], rgb[2:-2, 2:-2])
+
+
+@pytest.mark.parametrize("method", ["bilinear", "malvar"])
+def test_tiles_join_up(method):
+    data = numpy.random.RandomState(0).randint(0, 4096, (21, 19)).astype(
+        numpy.uint16)
+    cfa = ((2, 2), (1, 0, 2, 1))
+    whole = demosaic.demosaic(data, cfa, method=method)
+    tiled = demosaic.demosaic(data, cfa, method=method, tile_size=5)
+    assert (whole == tiled).all()
+
+
+def test_demosaic_in_parallel():
+    data = numpy.random.RandomState(1).randint(0, 4096, (40, 30)).astype(
+        numpy.uint16)
+    cfa = ((2, 2), (0, 1, 1, 2))
+    serial = demosaic.demosaic(data, cfa, method='malvar')
+    parallel = demosaic.demosaic(data, cfa, method='malvar', tile_size=8,
+                                 processes=2)
+    assert (serial == parallel).all()
+
+
+def test_integer_output_is_clipped():
+    data = numpy.random.RandomState(2).choice([0, 65535], (8, 8)).astype(
+        numpy.uint16)
+    out = demosaic.demosaic(data, ((2, 2), (0, 1, 1, 2)), method='malvar')
+    assert out.dtype == numpy.uint16
+    floats = demosaic.demosaic(data, ((2, 2), (0, 1, 1, 2)),
+                               method='malvar', dtype=numpy.float32)
+    assert floats.max() > 65535 and floats.min() < 0
+    assert (out == numpy.clip(numpy.rint(floats), 0, 65535)).all()
+
+
+def test_demosaic_invalid_arguments():
+    data = numpy.zeros((4, 4), dtype=numpy.uint16)
+    with pytest.raises(ValueError):
+        demosaic.demosaic(data, ((2, 2), (0, 1, 1, 2)), method='magic')
+    with pytest.raises(ValueError):
+        demosaic.demosaic(data, ((2, 2), (0, 1, 1, 3)))
+    with pytest.raises(ValueError):
+        demosaic.demosaic(data, ((2, 2), (0, 1, 1)))
+    with pytest.raises(ValueError):
+        demosaic.demosaic(data[0], ((2, 2), (0, 1, 1, 2)))
+    with pytest.raises(NotImplementedError):
+        demosaic.demosaic(data, ((2, 2), (0, 1, 2, 1)), method='malvar')
+    with pytest.raises(NotImplementedError):
+        demosaic.demosaic(data, ((1, 3), (0, 1, 2)), method='malvar')
+
+
+@pytest.mark.parametrize("pattern", bayer_patterns)
+def test_half_size_flat_color(pattern):
+    rgb = _flat(8, 10)
+    out = demosaic.half_size(_mosaic(rgb, pattern), ((2, 2), pattern))
+    assert out.shape == (4, 5, 3)
+    assert out.dtype == numpy.uint16
+    assert (out == rgb[:4, :5]).all()
+
+
+def test_half_size_averages_greens_and_drops_odd_edges():
+    data = numpy.array([[10, 20, 99],
+                        [30, 40, 99],
+                        [99, 99, 99]], dtype=numpy.uint16)
+    out = demosaic.half_size(data, ((2, 2), (0, 1, 1, 2)),
+                             dtype=numpy.float32)
+    assert out.tolist() == [[[10, 25, 40]]]
+
+
+def test_half_size_white_balance():
+    rgb = _flat(4, 4)
+    data = _mosaic(rgb, (0, 1, 1, 2))
+    out = demosaic.half_size(data, ((2, 2), (0, 1, 1, 2)),
+                             white_balance=(2, 1, 0.5))
+    assert (out == [200, 200, 25]).all()
+    out = demosaic.half_size(data, ((2, 2), (0, 1, 1, 2)),
+                             white_balance=(1000, 1, 1))
+    assert (out[..., 0] == 65535).all()
+
+
+def test_iter_half_size():
+    data = numpy.random.RandomState(3).randint(0, 4096, (11, 8)).astype(
+        numpy.uint16)
+    cfa = ((2, 2), (2, 1, 1, 0))
+    whole = demosaic.half_size(data, cfa)
+    chunks = [(0, data[0:3]), (3, data[3:4]), (4, data[4:9]),
+              (9, data[9:11])]
+    halves = list(demosaic.iter_half_size(chunks, cfa))
+    assert [first for first, _ in halves] == [0, 1, 2, 4]
+    assert (numpy.vstack([h for _, h in halves]) == whole).all()
+    # Chunks starting on an odd row skip to the next quad.
+    [(first, half)] = demosaic.iter_half_size([(1, data[1:5])], cfa)
+    assert first == 1
+    assert (half == whole[1:2]).all()
+
+
+def test_half_size_invalid_arguments():
+    data = numpy.zeros((4, 4), dtype=numpy.uint16)
+    with pytest.raises(NotImplementedError):
+        demosaic.half_size(data, ((2, 2), (0, 1, 2, 1)))
+    with pytest.raises(NotImplementedError):
+        demosaic.half_size(data, ((3, 3), (0, 1, 2) * 3))
+    with pytest.raises(ValueError):
+        demosaic.half_size(data[0], ((2, 2), (0, 1, 1, 2)))
+
+
+def test_render_half_size():
+    from rawphoto.cr2 import Cr2
+    from tests.stats_test import _raw_cr2
+    with Cr2(blob=_raw_cr2()) as cr2:
+        out = demosaic.render_half_size(cr2, rows=3)
+    assert out.shape == (3, 2, 3)
+    assert out[:, 0].tolist() == [[50, 100, 4095], [50, 102, 4095],
+                                  [50, 104, 4095]]
+    with Cr2(blob=_raw_cr2()) as cr2:
+        out = demosaic.render_half_size(cr2, white_balance=(2, 1, 1),
+                                        dtype=numpy.float32)
+    assert out[0, 0].tolist() == [100, 100.5, 4095]
+
+
+def test_render_half_size_errors():
+    from rawphoto.cr2 import Cr2
+    from tests.cr2_test import cr2_bytes
+    from tests.stats_test import _raw_cr2
+    with Cr2(blob=cr2_bytes) as cr2:
+        with pytest.raises(ValueError):
+            demosaic.render_half_size(cr2)
+    with Cr2(blob=_raw_cr2(cfa=False)) as cr2:
+        with pytest.raises(ValueError):
+            demosaic.render_half_size(cr2)
+        out = demosaic.render_half_size(cr2, cfa=((2, 2), (1, 0, 2, 1)))
+    assert out.shape == (3, 2, 3)
@@ -0,0 +1,164 @@
+from io import StringIO
+from rawphoto import cr2
+from rawphoto import export
+from rawphoto import nef
+from rawphoto.tiff import exif_tags
+from tests.cr2_header_test import header_bytes
+from tests.ifd_test import ifd_bytes_string_value
+
+import csv
+import json
+import pytest
+
+
+@pytest.fixture
+def raw_files(tmpdir):
+    # Value offsets in the IFD are relative to the start of the file.
+    ifd = ifd_bytes_string_value.replace(b'\x12', b'\x22')
+    tmpdir.join("good.CR2").write_binary(header_bytes + ifd)
+    tmpdir.join("bad.cr2").write_binary(b'not a raw file')
+    tmpdir.join("unknown.abc").write_binary(b'')
+    return [tmpdir.join(f).strpath
+            for f in ["good.CR2", "bad.cr2", "unknown.abc"]]
+
+
+def test_columns_are_unique_and_fixed():
+    assert export.columns[:3] == ['path', 'format', 'error']
+    assert len(set(export.columns)) == len(export.columns)
+    assert 'make' in export.columns
+    assert 'canon_model_id' in export.columns
+    assert 'exif' not in export.columns
+    assert 'makernote' not in export.columns
+
+
+def test_columns_cover_every_tag_table():
+    for table in (exif_tags, cr2.tags, nef.tags):
+        for name in table.values():
+            if isinstance(name, str) and name not in export.excluded_tags:
+                assert name in export.columns
+    assert 'canon_camera_settings' in export.columns
+    assert 'interop_index' in export.columns
+
+
+def test_read_row(raw_files):
+    row = dict(zip(export.columns, export._read_row(raw_files[0])))
+    assert row['format'] == 'CR2'
+    assert row['make'] == 'Canon'
+    assert row['error'] is None
+    assert row['model'] is None
+
+
+def test_read_row_errors(raw_files):
+    bad = dict(zip(export.columns, export._read_row(raw_files[1])))
+    assert bad['error'] is not None
+    unknown = dict(zip(export.columns, export._read_row(raw_files[2])))
+    assert unknown['error'].startswith('KeyError')
+
+
+def test_format_value():
+    assert export._format_value(b'\x01\xff') == '01ff'
+    assert export._format_value((1, 2)) == [1, 2]
+    assert export._format_value(3) == 3
+
+
+def test_iter_batches_are_bounded(raw_files):
+    batches = list(export.iter_batches(iter(raw_files), batch_size=2))
+    assert [len(b['path']) for b in batches] == [2, 1]
+    assert batches[0]['make'] == ['Canon', None]
+    assert set(batches[0]) == set(export.columns)
+
+
+def test_iter_batches_in_parallel(raw_files):
+    batches = list(export.iter_batches(raw_files * 3, batch_size=4,
+                                       processes=2))
+    assert sum(len(b['path']) for b in batches) == 9
+    assert batches[0]['path'][:3] == raw_files
+
+
+def test_write_csv(raw_files):
+    out = StringIO()
+    export.write_csv(raw_files, out, batch_size=1,
+                     columns=['path', 'make', 'x_resolution'])
+    out.seek(0)
+    rows = list(csv.reader(out))
+    assert rows[0] == ['path', 'make', 'x_resolution']
+    assert rows[1] == [raw_files[0], 'Canon', '']
+    assert len(rows) == 4
+
+
+def test_csv_value():
+    assert export._csv_value(None) == ''
+    assert export._csv_value([1, 2]) == '1 2'
+
+
+def test_write_json_lines(raw_files):
+    out = StringIO()
+    export.write_json_lines(raw_files, out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3
+    row = json.loads(lines[0])
+    assert row['make'] == 'Canon'
+    assert set(row) == set(export.columns)
+
+
+def test_write_parquet(raw_files, tmpdir):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    p = tmpdir.join("out.parquet").strpath
+    export.write_parquet(raw_files, p, batch_size=2)
+    table = parquet.read_table(p)
+    assert table.num_rows == 3
+    assert table.column_names == export.columns
+    assert table.column('make').to_pylist() == ['Canon', None, None]
+
+
+def test_iter_batches_in_parallel_reads_ahead_one_batch(raw_files):
+    consumed = []
+
+    def paths():
+        for i in range(20):
+            consumed.append(i)
+            yield raw_files[0]
+
+    batches = export.iter_batches(paths(), batch_size=2, processes=2)
+    next(batches)
+    assert len(consumed) <= 4
+    assert sum(len(b['path']) for b in batches) == 18
+    assert len(consumed) == 20
+
+
+def test_arrow_types():
+    pyarrow = pytest.importorskip("pyarrow")
+    assert export._arrow_type(pyarrow, [1, None, 2]) == pyarrow.int64()
+    assert export._arrow_type(pyarrow, [1, 2.5]) == pyarrow.float64()
+    assert export._arrow_type(pyarrow, [1, [2, 3]]) == \
+        pyarrow.list_(pyarrow.int64())
+    assert export._arrow_type(pyarrow, [[1.5], 2]) == \
+        pyarrow.list_(pyarrow.float64())
+    assert export._arrow_type(pyarrow, ['a', 1]) == pyarrow.string()
+    assert export._arrow_type(pyarrow, [None]) == pyarrow.string()
+    int_list = pyarrow.list_(pyarrow.int64())
+    assert export._arrow_value(pyarrow, 3, int_list) == [3]
+    assert export._arrow_value(pyarrow, 'a', pyarrow.int64()) is None
+    assert export._arrow_value(pyarrow, [1, 2], pyarrow.string()) == '1 2'
+    assert export._arrow_value(pyarrow, 2, pyarrow.float64()) == 2.0
+
+
+def test_write_parquet_typed_columns(tmpdir):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    from tests.patch_test import _cr2_bytes
+    tmpdir.join("typed.CR2").write_binary(_cr2_bytes())
+    paths = [tmpdir.join("typed.CR2").strpath] * 3
+    p = tmpdir.join("out.parquet").strpath
+    export.write_parquet(paths, p, batch_size=2)
+    table = parquet.read_table(p)
+    assert str(table.schema.field('orientation').type) == 'int64'
+    assert str(table.schema.field('model').type) == 'string'
+    assert table.column('orientation').to_pylist() == [1, 1, 1]
+    assert table.column('model').to_pylist() == ['EOS'] * 3
+
+
+def test_write_parquet_no_files(tmpdir):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    p = tmpdir.join("out.parquet").strpath
+    export.write_parquet([], p)
+    assert parquet.read_table(p).num_rows == 0
@@ -0,0 +1,71 @@
+from rawphoto import fingerprint
+from rawphoto.cr2 import Cr2
+from tests.cr2_header_test import header_bytes
+from tests.raw_test import _ifd
+
+import hashlib
+import pytest
+import struct
+
+raw_sensor_data = bytes(bytearray(range(256))) * 40
+
+
+def _cr2(make=b'Canon\x00'):
+    data = 16 + 54
+    return header_bytes + _ifd([
+        (0x0106, 3, 1, 32803),
+        (0x0111, 4, 1, data + len(make)),
+        (0x0117, 4, 1, len(raw_sensor_data)),
+        (0x010f, 2, len(make), data)
+    ]) + make + raw_sensor_data
+
+
+def test_fingerprint_hashes_only_raw_data():
+    expected = hashlib.sha1(struct.pack('>Q', len(raw_sensor_data)) +
+                            raw_sensor_data).hexdigest()
+    with Cr2(blob=_cr2()) as cr2:
+        assert fingerprint.fingerprint(cr2) == expected
+    with Cr2(blob=_cr2(make=b'Nikon?\x00')) as cr2:
+        assert fingerprint.fingerprint(cr2) == expected
+
+
+def test_fingerprint_mmap_matches_read(tmpdir, monkeypatch):
+    monkeypatch.setattr(fingerprint, 'chunk_size', 1000)
+    tmpdir.join('file.CR2').write_binary(_cr2())
+    with Cr2(filename=tmpdir.join('file.CR2').strpath) as cr2:
+        pos = cr2.tell()
+        mapped = fingerprint.fingerprint(cr2)
+        sampled = fingerprint.sampled_fingerprint(cr2, blocks=4,
+                                                  block_size=100)
+        assert cr2.tell() == pos
+    with Cr2(blob=_cr2()) as cr2:
+        assert fingerprint.fingerprint(cr2) == mapped
+        assert fingerprint.sampled_fingerprint(cr2, blocks=4,
+                                               block_size=100) == sampled
+
+
+def test_sampled_fingerprint():
+    with Cr2(blob=_cr2()) as cr2:
+        full = fingerprint.fingerprint(cr2)
+        sampled = fingerprint.sampled_fingerprint(cr2, blocks=4,
+                                                  block_size=100)
+        assert sampled != full
+        # Ranges smaller than the sample are hashed entirely.
+        assert fingerprint.sampled_fingerprint(cr2) != sampled
+    with Cr2(blob=_cr2(make=b'Nikon?\x00')) as cr2:
+        assert fingerprint.sampled_fingerprint(cr2, blocks=4,
+                                               block_size=100) == sampled
+
+
+def test_sample_ranges():
+    assert fingerprint._sample_ranges(10, 1000, 3, 100) == [
+        (10, 100), (460, 100), (910, 100)]
+    assert fingerprint._sample_ranges(10, 200, 3, 100) == [(10, 200)]
+    assert fingerprint._sample_ranges(10, 1000, 1, 100) == [(10, 1000)]
+
+
+def test_fingerprint_no_raw_data():
+    from tests.cr2_test import cr2_bytes
+    with Cr2(blob=cr2_bytes) as cr2:
+        with pytest.raises(ValueError):
+            fingerprint.fingerprint(cr2)
@@ -1,7 +1,10 @@
 from rawphoto.tiff import Ifd
+from rawphoto.tiff import IfdEntries
+from rawphoto.tiff import IfdEntry
 
 import os
 import pytest
+import struct
 
 ifd_bytes = b'''\
 \x02\x00\x01\x02\x04\x00\x01\x00\x00\x00\x00\x00\x00\x00\x02\x02\x04\x00\x01\
@@ -117,3 +120,77 @@ def test_ifd_invalid_pointer():
     ifd = Ifd("<", blob=ifd_bytes_invalid_pointer)
     val = ifd.get_value(ifd.entries['make'])
     assert val == 303174162
+
+
+def test_ifd_records_entry_offsets():
+    ifd = Ifd("<", blob=b'\x00' + ifd_bytes, offset=1)
+    assert ifd.entry_offsets['data_offset'] == 3
+    assert ifd.entry_offsets['data_length'] == 15
+
+
+def test_ifd_entries_are_compact():
+    ifd = Ifd("<", blob=ifd_bytes)
+    assert isinstance(ifd.entries, IfdEntries)
+    assert not hasattr(ifd.entries, '__dict__')
+    assert list(ifd.entries) == ['data_offset', 'data_length']
+    assert ifd.entries.get('make') is None
+    assert ifd.entries.get('data_length').raw_value == 2
+    assert [e.tag_id for e in ifd.entries.values()] == [0x0201, 0x0202]
+
+
+@pytest.mark.parametrize("blob", [
+    ifd_bytes, ifd_bytes_sub_ifd, ifd_bytes_string_value,
+    ifd_bytes_byte_array, ifd_bytes_double, ifd_bytes_float,
+    ifd_bytes_invalid_pointer
+])
+def test_ifd_entries_match_ifd_entry(blob):
+    ifd = Ifd("<", blob=blob)
+    for i in range(struct.unpack_from('<H', blob)[0]):
+        expected = IfdEntry("<", blob=blob, offset=2 + 12 * i)
+        assert ifd.entries[expected.tag_name] == expected
+
+
+def test_ifd_entries_inline_values():
+    table = struct.pack('>HHL2H', 0x828d, 3, 2, 2, 3) + \
+        struct.pack('>HHL4B', 0x828e, 1, 4, 0, 1, 1, 2) + \
+        struct.pack('>HHLb3x', 0x0112, 6, 1, -1) + \
+        struct.pack('>HHLL', 0xc5c6, 4, 1, 7)
+    entries = IfdEntries(">", table, table_offset=100)
+    assert entries['cfa_repeat_pattern_dim'].raw_value == (2, 3)
+    assert entries['cfa_pattern_two'].raw_value == (0, 1, 1, 2)
+    assert entries['orientation'].raw_value == -1
+    # Unknown tags are named by their id.
+    assert entries[0xc5c6].raw_value == 7
+    assert 0x0112 not in entries
+    assert ['x'] not in entries
+    assert entries.offset('orientation') == 124
+    with pytest.raises(KeyError):
+        entries.offset('make')
+    with pytest.raises(KeyError):
+        entries['make']
+
+
+def test_ifd_signed_long_values():
+    # A LONG is four bytes in a TIFF file whatever the native size of 'l'.
+    blob = struct.pack('<HHHLl', 1, 0x0100, 9, 1, -5) + \
+        struct.pack('<L', 0)
+    ifd = Ifd("<", blob=blob)
+    assert ifd.get_value(ifd.entries['image_width']) == -5
+    assert IfdEntry("<", blob=blob, offset=2).raw_value == -5
+
+
+def test_ifd_entries_duplicate_names():
+    # The last entry with a name wins, like assigning to a dict.
+    table = struct.pack('<HHLL', 0x0202, 4, 1, 5) + \
+        struct.pack('<HHLL', 0x0117, 4, 1, 9)
+    entries = IfdEntries("<", table)
+    assert len(entries) == 1
+    assert entries['data_length'].raw_value == 9
+    assert entries.offset('data_length') == 12
+
+
+def test_ifd_entries_invalid():
+    with pytest.raises(KeyError):
+        IfdEntries("<", struct.pack('<HHLL', 0x0112, 0xff, 1, 1))
+    with pytest.raises(struct.error):
+        IfdEntries("<", struct.pack('<HHLL', 0x0112, 3, 1, 1)[:-1])
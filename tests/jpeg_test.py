@@ -0,0 +1,124 @@
+from io import BytesIO
+from rawphoto.jpeg import JpegHeader
+
+import os
+import pytest
+import struct
+
+# SOI, APP0 (JFIF), SOF0 (3 components, 640x480), DRI, SOS, scan data, EOI
+jpeg_bytes = (
+    b'\xff\xd8' +
+    b'\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00' +
+    b'\xff\xc0\x00\x11\x08' + struct.pack('>HH', 480, 640) +
+    b'\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01' +
+    b'\xff\xdd\x00\x04\x00\x08' +
+    b'\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00' +
+    b'\x12\x34\x56\x78' +
+    b'\xff\xd9'
+)
+
+# A lossless (SOF3) frame, as used for CR2 raw data, with fill bytes
+jpeg_bytes_lossless = (
+    b'\xff\xd8\xff\xff\xc3\x00\x14\x0e' + struct.pack('>HH', 3516, 1320) +
+    b'\x04\x01\x11\x00\x02\x11\x00\x03\x11\x00\x04\x11\x00' +
+    b'\xff\xda\x00\x08\x01\x01\x00\x01\x00\x00'
+)
+
+
+def test_jpeg_header_must_have_single_data_source():
+    with pytest.raises(TypeError):
+        JpegHeader()
+    with pytest.raises(TypeError):
+        JpegHeader(blob=jpeg_bytes, file=1)
+
+
+def test_jpeg_header_from_blob():
+    header = JpegHeader(blob=jpeg_bytes)
+    assert header.process == 'baseline'
+    assert header.precision == 8
+    assert header.width == 640
+    assert header.height == 480
+    assert header.components == 3
+    assert header.sampling == (0x22, 0x11, 0x11)
+    assert header.restart_interval == 8
+
+
+def test_jpeg_header_lossless_with_fill_bytes():
+    header = JpegHeader(blob=jpeg_bytes_lossless)
+    assert header.process == 'lossless'
+    assert header.precision == 14
+    assert header.width == 1320
+    assert header.height == 3516
+    assert header.components == 4
+    assert header.restart_interval == 0
+
+
+def test_jpeg_header_from_file_with_offset(tmpdir):
+    p = tmpdir.realpath().strpath
+    with open(os.path.join(p, 'jpeg'), mode='w+b') as tmpfile:
+        tmpfile.write(b'\x00' * 10 + jpeg_bytes)
+        tmpfile.seek(3)
+        header = JpegHeader(file=tmpfile, offset=10, length=len(jpeg_bytes))
+        assert header.width == 640
+        assert tmpfile.tell() == 3
+
+
+def test_jpeg_header_must_not_read_scan_data():
+    # Anything after the start of scan may be garbage.
+    blob = jpeg_bytes[:jpeg_bytes.index(b'\xff\xda')] + b'\xff\xda\x00\x0c\x03'
+    assert JpegHeader(blob=blob).width == 640
+
+
+def test_jpeg_header_invalid_start():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'II*\x00')
+
+
+def test_jpeg_header_no_frame():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xd9')
+
+
+def test_jpeg_header_segment_past_length():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=jpeg_bytes, length=10)
+
+
+def test_jpeg_header_truncated_frame():
+    blob = jpeg_bytes_lossless.replace(b'\x04\x01', b'\x09\x01')
+    with pytest.raises(ValueError):
+        JpegHeader(blob=blob)
+
+
+def test_jpeg_header_truncated():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xe0\x00')
+
+
+def test_jpeg_header_fill_bytes_to_end_of_file():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xff\xff\xff')
+
+
+def test_jpeg_header_fill_bytes_past_length():
+    f = BytesIO(b'\xff\xd8' + b'\xff' * 100)
+    with pytest.raises(ValueError):
+        JpegHeader(file=f, length=4, rewind=False)
+    assert f.tell() <= 4
+
+
+def test_jpeg_header_short_segment_length():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xe0\x00\x01')
+
+
+def test_jpeg_header_short_frame():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xc0\x00\x04\x08\x00')
+
+
+def test_jpeg_header_bad_restart_interval():
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xdd\x00\x03\x00\xff\xd9')
+    with pytest.raises(ValueError):
+        JpegHeader(blob=b'\xff\xd8\xff\xdd\x00\x04\x00')
@@ -0,0 +1,183 @@
+from rawphoto import patch
+from rawphoto.cr2 import Cr2
+from tests.cr2_header_test import header_bytes
+from tests.raw_test import _ifd
+
+import json
+import os
+import pytest
+import struct
+
+datetime = b'2015:01:01 12:00:00\x00'
+
+
+def _cr2_bytes():
+    data = 16 + 54
+    return header_bytes + _ifd([
+        (0x0112, 3, 1, 1),
+        (0x0132, 2, 20, data),
+        (0x0110, 2, 4, data + 20),
+        (0x829a, 5, 1, data + 24)
+    ]) + datetime + b'EOS\x00' + b'\x01\x00\x00\x00\xc8\x00\x00\x00'
+
+
+@pytest.fixture
+def cr2_file(tmpdir):
+    tmpdir.join("file.CR2").write_binary(_cr2_bytes())
+    return tmpdir.join("file.CR2").strpath
+
+
+def _values(filename):
+    with Cr2(filename=filename) as cr2:
+        ifd = cr2.ifds[0]
+        return dict((name, ifd.get_value(e))
+                    for name, e in ifd.entries.items())
+
+
+def test_patch_inline_value_is_a_single_write(cr2_file):
+    with Cr2(filename=cr2_file) as cr2:
+        writes = patch.plan_patch(cr2, {'orientation': 6})
+    assert writes == [(16 + 2 + 4, b'\x01\x00\x00\x00\x06\x00\x00\x00')]
+    patch.patch_file(cr2_file, {'orientation': 6})
+    assert _values(cr2_file)['orientation'] == 6
+    assert os.path.getsize(cr2_file) == len(_cr2_bytes())
+
+
+def test_patch_value_in_place(cr2_file):
+    patch.patch_file(cr2_file, {'datetime': u'2016:02:02 13:30:00'})
+    values = _values(cr2_file)
+    assert values['datetime'] == '2016:02:02 13:30:00'
+    assert values['model'] == 'EOS'
+    assert os.path.getsize(cr2_file) == len(_cr2_bytes())
+
+
+def test_patch_shorter_value_updates_count(cr2_file):
+    with Cr2(filename=cr2_file) as cr2:
+        writes = patch.plan_patch(cr2, {'datetime': b'2016\x00'})
+    assert len(writes) == 2
+    patch.patch_file(cr2_file, {'datetime': b'2016\x00'})
+    assert _values(cr2_file)['datetime'] == '2016'
+
+
+def test_patch_short_string_round_trips(cr2_file):
+    with Cr2(filename=cr2_file) as cr2:
+        entry = cr2.ifds[0].entries['model']
+        writes = patch.plan_patch(cr2, {'model': 'A'})
+    assert writes[0] == (entry.raw_value, b'A\x00')
+    patch.patch_file(cr2_file, {'model': 'A'})
+    values = _values(cr2_file)
+    assert values['model'] == 'A'
+    assert values['datetime'] == datetime[:-1].decode('ascii')
+    assert os.path.getsize(cr2_file) == len(_cr2_bytes())
+
+
+def _long_cr2_bytes():
+    # LONG and SLONG tags, with one value (inline) and with two (at an
+    # offset).
+    data = 16 + 54
+    return header_bytes + _ifd([
+        (0x0100, 4, 1, 6000),
+        (0x0101, 9, 1, 0xfffffffb),
+        (0x0111, 4, 2, data),
+        (0x0117, 9, 2, data + 8)
+    ]) + struct.pack('<2L2l', 100, 200, -1, -2)
+
+
+def test_patch_long_values(tmpdir):
+    tmpdir.join("long.CR2").write_binary(_long_cr2_bytes())
+    p = tmpdir.join("long.CR2").strpath
+    with Cr2(filename=p) as cr2:
+        assert patch.plan_patch(cr2, {'image_width': 5000}) == [
+            (16 + 2 + 4, b'\x01\x00\x00\x00\x88\x13\x00\x00')]
+    patch.patch_file(p, {'image_width': 5000, 'image_height': -7,
+                         'data_offset': (300, 400),
+                         'data_length': (-3, -4)})
+    values = _values(p)
+    assert values['image_width'] == 5000
+    assert values['image_height'] == -7
+    assert values['data_offset'] == (300, 400)
+    assert values['data_length'] == (-3, -4)
+    assert os.path.getsize(p) == len(_long_cr2_bytes())
+
+
+def test_patch_long_values_appended(tmpdir):
+    tmpdir.join("long.CR2").write_binary(_long_cr2_bytes())
+    p = tmpdir.join("long.CR2").strpath
+    patch.patch_file(p, {'image_width': (1, 2), 'data_length': (-3, -4, -5)})
+    values = _values(p)
+    assert values['image_width'] == (1, 2)
+    assert values['data_length'] == (-3, -4, -5)
+    assert values['data_offset'] == (100, 200)
+    assert os.path.getsize(p) == len(_long_cr2_bytes()) + 8 + 12
+
+
+def test_patch_larger_value_is_appended(cr2_file):
+    size = len(_cr2_bytes())
+    patch.patch_file(cr2_file, {'model': 'EOS 5D Mark III'})
+    values = _values(cr2_file)
+    assert values['model'] == 'EOS 5D Mark III'
+    assert values['datetime'] == datetime[:-1].decode('ascii')
+    assert os.path.getsize(cr2_file) == size + len('EOS 5D Mark III') + 1
+
+
+def test_patch_appended_values_are_word_aligned(tmpdir):
+    tmpdir.join("odd.CR2").write_binary(_cr2_bytes() + b'\x00')
+    p = tmpdir.join("odd.CR2").strpath
+    patch.patch_file(p, {'model': 'EOS 7D', 'orientation': (3,)})
+    with Cr2(filename=p) as cr2:
+        entry = cr2.ifds[0].entries['model']
+        assert entry.raw_value % 2 == 0
+        assert cr2.ifds[0].get_value(entry) == 'EOS 7D'
+        assert cr2.ifds[0].entries['orientation'].raw_value == 3
+
+
+def test_patch_unknown_tag(cr2_file):
+    with pytest.raises(KeyError):
+        patch.patch_file(cr2_file, {'lens_model': 'EF 50mm'})
+
+
+def test_patch_rational(cr2_file):
+    with pytest.raises(TypeError):
+        patch.patch_file(cr2_file, {'exposure_time': 1})
+
+
+def test_patch_files(tmpdir):
+    paths = []
+    for i in range(3):
+        tmpdir.join("{}.CR2".format(i)).write_binary(_cr2_bytes())
+        paths.append(tmpdir.join("{}.CR2".format(i)).strpath)
+    journal = tmpdir.join("journal").strpath
+    patch.patch_files([(p, {'orientation': 8, 'model': 'EOS 60D'})
+                       for p in paths], journal)
+    assert not os.path.exists(journal)
+    for p in paths:
+        values = _values(p)
+        assert values['orientation'] == 8
+        assert values['model'] == 'EOS 60D'
+
+
+def test_recover_interrupted_patch(tmpdir, cr2_file, monkeypatch):
+    journal = tmpdir.join("journal").strpath
+
+    def crash(fhandle, writes):
+        # Scribble over every planned write, then die.
+        for write in writes:
+            fhandle.seek(write.offset)
+            fhandle.write(b'\xff' * len(write.data))
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(patch, '_apply_writes', crash)
+    with pytest.raises(KeyboardInterrupt):
+        patch.patch_files([(cr2_file, {'model': 'EOS 60D'})], journal)
+    assert os.path.exists(journal)
+    with open(journal) as f:
+        assert json.load(f)[0]['size'] == len(_cr2_bytes())
+
+    with pytest.raises(IOError):
+        patch.patch_files([(cr2_file, {'model': 'EOS 60D'})], journal)
+
+    patch.recover(journal)
+    assert not os.path.exists(journal)
+    with open(cr2_file, 'rb') as f:
+        assert f.read() == _cr2_bytes()
+    # Recovering without a journal does nothing.
+    patch.recover(journal)
@@ -0,0 +1,89 @@
+from rawphoto.cr2 import Cr2
+from rawphoto.pool import HandlePool
+from rawphoto.pool import PooledFile
+from rawphoto.pool import PoolStats
+from tests.cr2_test import cr2_multiple_ifds
+
+import os
+import pytest
+
+
+@pytest.fixture
+def cr2_files(tmpdir):
+    paths = []
+    for i in range(3):
+        tmpdir.join("file{}.CR2".format(i)).write_binary(cr2_multiple_ifds)
+        paths.append(tmpdir.join("file{}.CR2".format(i)).strpath)
+    return paths
+
+
+def test_pool_size_must_be_positive():
+    with pytest.raises(ValueError):
+        HandlePool(size=0)
+
+
+def test_pooled_file_reads_and_seeks(cr2_files):
+    pool = HandlePool()
+    with PooledFile(cr2_files[0], pool) as f:
+        assert f.read(4) == cr2_multiple_ifds[:4]
+        assert f.tell() == 4
+        f.seek(2, os.SEEK_CUR)
+        assert f.read(2) == cr2_multiple_ifds[6:8]
+        f.seek(-2, os.SEEK_END)
+        assert f.read() == cr2_multiple_ifds[-2:]
+        f.seek(0)
+        assert f.read(None) == cr2_multiple_ifds
+        with pytest.raises(ValueError):
+            f.seek(-1)
+        with pytest.raises(ValueError):
+            f.seek(0, 5)
+        assert os.fstat(f.fileno()).st_size == len(cr2_multiple_ifds)
+    assert f.closed
+    with pytest.raises(ValueError):
+        f.read()
+    pool.close()
+
+
+def test_pooled_file_missing_file(tmpdir):
+    with pytest.raises(EnvironmentError):
+        PooledFile(tmpdir.join("missing.CR2").strpath, HandlePool())
+
+
+def test_pool_bounds_open_handles(cr2_files):
+    pool = HandlePool(size=2)
+    raws = [Cr2(filename=p, pool=pool) for p in cr2_files]
+    assert pool.stats.open_handles == 2
+    for raw in raws:
+        assert len(raw.ifds) == 4
+        assert raw.raw_data == b'II'
+    stats = pool.stats
+    assert stats.open_handles == 2
+    assert stats.reopens == 3
+    assert stats.misses == 6
+    assert 0 < stats.hit_rate < 1
+    for raw in raws:
+        raw.close()
+    pool.close()
+    assert pool.stats.open_handles == 0
+
+
+def test_pool_hits(cr2_files):
+    pool = HandlePool(size=1)
+    with Cr2(filename=cr2_files[0], pool=pool) as cr2:
+        cr2.raw_data
+        cr2.thumbnail_image
+    assert pool.stats.misses == 1
+    assert pool.stats.reopens == 0
+    pool.discard(cr2_files[0])
+    pool.discard(cr2_files[0])
+    assert pool.stats.open_handles == 0
+
+
+def test_pool_stats_hit_rate():
+    assert PoolStats(0, 0, 0, 0).hit_rate == 0.0
+    assert PoolStats(3, 1, 0, 1).hit_rate == 0.75
+
+
+def test_pool_requires_filename():
+    with pytest.raises(TypeError):
+        Cr2(blob=cr2_multiple_ifds, pool=HandlePool())
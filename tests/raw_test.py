@@ -1,4 +1,5 @@
 import pytest
+import struct
 
 from rawphoto import raw
 from rawphoto.raw import Raw
@@ -29,6 +30,14 @@ def test_discover_must_be_case_insensitive(tmpdir):
     assert len(raw.discover(tmpdir.strpath)) == 4
 
 
+def test_get_parser():
+    from rawphoto.nef import Nef
+    assert raw.get_parser('/photos/IMG_0001.cr2') is Cr2
+    assert raw.get_parser('DSC_0001.NEF') is Nef
+    with pytest.raises(KeyError):
+        raw.get_parser('file.abc')
+
+
 def test_discover_must_ignore_unsupported_extensions(tmpdir):
     tmpdir.join("file.abc").write("")
     assert len(raw.discover(tmpdir.strpath)) == 0
@@ -53,3 +62,196 @@ def test_fetching_image_no_exists():
 def test_fetching_image():
     with Cr2(blob=header_bytes + ifd_strip_image) as cr2:
         assert cr2._get_image_data() == b'II' == cr2.preview_image
+
+
+def test_fetching_image_header():
+    from tests.jpeg_test import jpeg_bytes
+    ifd = struct.pack('<HHHLLHHLL', 2, 0x0111, 4, 1, 46, 0x0117, 4, 1,
+                      len(jpeg_bytes)) + b'\x00\x00\x00\x00'
+    with Cr2(blob=header_bytes + ifd + jpeg_bytes) as cr2:
+        header = cr2.preview_image_header
+        assert header == cr2._get_image_header()
+        assert header.width == 640
+        assert header.height == 480
+
+
+def test_fetching_image_header_no_exists():
+    with Cr2(blob=header_bytes + ifd_bytes_string_value) as cr2:
+        assert cr2._get_image_header(num=0) is None
+
+
+def _ifd(entries, next_ifd_offset=0):
+    blob = struct.pack('<H', len(entries))
+    for tag_id, tag_type, value_len, value in entries:
+        if isinstance(value, bytes):
+            fmt = '<HHL4s'
+        elif tag_type == 3:
+            fmt = '<HHLH2x'
+        else:
+            fmt = '<HHLL'
+        blob += struct.pack(fmt, tag_id, tag_type, value_len, value)
+    return blob + struct.pack('<L', next_ifd_offset)
+
+
+def _multiple_images_cr2():
+    from tests.jpeg_test import jpeg_bytes
+    small_jpeg = jpeg_bytes.replace(struct.pack('>HH', 480, 640),
+                                    struct.pack('>HH', 120, 160))
+    ifd0 = 16
+    ifd1 = ifd0 + 42
+    ifd2 = ifd1 + 42
+    ifd3 = ifd2 + 66
+    data = ifd3 + 66
+    blob = header_bytes + _ifd([
+        (0x0103, 3, 1, 6),
+        (0x0111, 4, 1, data),
+        (0x0117, 4, 1, len(jpeg_bytes))
+    ], ifd1) + _ifd([
+        (0x0103, 3, 1, 6),
+        (0x0201, 4, 1, data + len(jpeg_bytes)),
+        (0x0202, 4, 1, len(small_jpeg))
+    ], ifd2) + _ifd([
+        (0x0100, 3, 1, 2),
+        (0x0101, 3, 1, 1),
+        (0x0103, 3, 1, 1),
+        (0x0111, 4, 1, data + len(jpeg_bytes) + len(small_jpeg)),
+        (0x0117, 4, 1, 6)
+    ], ifd3) + _ifd([
+        (0x0103, 3, 1, 1),
+        (0x0106, 3, 1, 32803),
+        (0x0100, 3, 1, 6000),
+        (0x0111, 4, 1, data),
+        (0x0117, 4, 1, 2)
+    ])
+    return blob + jpeg_bytes + small_jpeg + b'RGBRGB'
+
+
+def test_embedded_images():
+    with Cr2(blob=_multiple_images_cr2()) as cr2:
+        images = cr2.embedded_images
+        assert [(i.num, i.width, i.height) for i in images] == [
+            (0, 640, 480), (1, 160, 120), (2, 2, 1), (3, 6000, None)]
+        assert [i.compression for i in images] == [6, 6, 1, 1]
+        assert [i.is_raw for i in images] == [False, False, False, True]
+        assert images[2].length == 6
+
+
+def test_find_image_smallest_large_enough():
+    with Cr2(blob=_multiple_images_cr2()) as cr2:
+        assert cr2.find_image().num == 2
+        assert cr2.find_image(100, 100).num == 1
+        assert cr2.find_image(161, 100).num == 0
+        assert cr2.find_image(1000, 1000) is None
+
+
+def test_get_image():
+    from tests.jpeg_test import jpeg_bytes
+    with Cr2(blob=_multiple_images_cr2()) as cr2:
+        assert cr2.get_image(300, 300) == jpeg_bytes
+        assert cr2.get_image(0, 0) == b'RGBRGB'
+        assert cr2.get_image(1000, 1000) is None
+
+
+def test_embedded_images_unreadable_jpeg():
+    with Cr2(blob=header_bytes + ifd_strip_image) as cr2:
+        [image] = cr2.embedded_images
+        assert image.width is None
+        assert cr2.find_image() is None
+
+
+def test_embedded_images_saturated_samples():
+    # Untagged compression, and data that looks like JPEG fill bytes.
+    blob = header_bytes + _ifd([
+        (0x0111, 4, 1, 46),
+        (0x0117, 4, 1, 8)
+    ]) + b'\xff' * 8
+    with Cr2(blob=blob) as cr2:
+        [image] = cr2.embedded_images
+        assert image.width is None
+        assert cr2.find_image() is None
+
+
+def test_embedded_images_in_sub_ifds():
+    from rawphoto.nef import Nef
+    from tests.jpeg_test import jpeg_bytes
+    data = 130
+    blob = b'II*\x00\x08\x00\x00\x00' + _ifd([
+        (0x014a, 4, 2, 26)
+    ]) + struct.pack('<LL', 34, 76) + _ifd([
+        (0x0103, 3, 1, 6),
+        (0x0201, 4, 1, data),
+        (0x0202, 4, 1, len(jpeg_bytes))
+    ]) + _ifd([
+        (0x0103, 3, 1, 1),
+        (0x0106, 3, 1, 32803),
+        (0x0111, 4, 1, data + len(jpeg_bytes)),
+        (0x0117, 4, 1, 4)
+    ]) + jpeg_bytes + b'\x00\x01\x02\x03'
+    with Nef(blob=blob) as nef:
+        images = nef.embedded_images
+        assert [(i.name, i.is_raw) for i in images] == [
+            ('preview_image', False), ('raw_data', True)]
+        assert nef.get_image(640, 480) == nef.preview_image == jpeg_bytes
+
+
+def _strips_cr2():
+    # Three 2 row strips, stored out of order with a gap between them.
+    ifd = 16
+    arrays = ifd + 54
+    data = arrays + 24
+    blob = header_bytes + _ifd([
+        (0x0101, 3, 1, 6),
+        (0x0111, 4, 3, arrays),
+        (0x0116, 3, 1, 2),
+        (0x0117, 4, 3, arrays + 12)
+    ]) + struct.pack('<6L', data + 8, data, data + 4, 4, 2, 4)
+    return blob + b'bb..ccccaaaa'
+
+
+def test_coalesce_strips():
+    strips = [(100, 4), (0, 2), (104, 4), (10, 1)]
+    assert list(raw._coalesce(strips, gap=8)) == [
+        (0, 11, [(4, 2), (None, 8), (10, 1)]),
+        (100, 8, [(0, 4), (6, 4)])
+    ]
+    assert list(raw._coalesce(strips, gap=0)) == [
+        (0, 2, [(4, 2)]), (10, 1, [(10, 1)]), (100, 8, [(0, 4), (6, 4)])
+    ]
+    assert list(raw._coalesce([])) == []
+
+
+def test_fetching_image_strips(tmpdir, monkeypatch):
+    with Cr2(blob=_strips_cr2()) as cr2:
+        assert cr2._get_image_strips() == [(102, 4), (94, 2), (98, 4)]
+        assert cr2._get_image_data() == b'aaaabbcccc'
+        assert cr2.embedded_images[0].length == 10
+    tmpdir.join("strips.CR2").write_binary(_strips_cr2())
+    with Cr2(filename=tmpdir.join("strips.CR2").strpath) as cr2:
+        assert cr2._get_image_data() == b'aaaabbcccc'
+        monkeypatch.setattr(raw, 'coalesce_gap', 0)
+        assert cr2._get_image_data() == b'aaaabbcccc'
+
+
+def test_fetching_image_strips_truncated():
+    with Cr2(blob=_strips_cr2()[:-2]) as cr2:
+        with pytest.raises(IOError):
+            cr2._get_image_data()
+
+
+def test_fetching_image_rows():
+    with Cr2(blob=_strips_cr2()) as cr2:
+        assert cr2._get_image_rows(0, 6) == (0, b'aaaabbcccc')
+        assert cr2._get_image_rows(2, 4) == (2, b'bb')
+        assert cr2._get_image_rows(3, 5) == (2, b'bbcccc')
+        assert cr2._get_image_rows(5, 5) == (4, b'cccc')
+    with Cr2(blob=header_bytes + ifd_strip_image) as cr2:
+        assert cr2._get_image_rows(0, 1) == (0, b'II')
+    with Cr2(blob=header_bytes + ifd_bytes_string_value) as cr2:
+        assert cr2._get_image_rows(0, 1) is None
+
+
+def test_slice_strips():
+    strips = [(100, 4), (10, 4), (50, 4)]
+    assert raw._slice_strips(strips, 0, 12) == strips
+    assert raw._slice_strips(strips, 2, 4) == [(102, 2), (10, 2)]
+    assert raw._slice_strips(strips, 9, 10) == [(51, 3)]
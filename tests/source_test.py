@@ -0,0 +1,252 @@
+from rawphoto.cr2 import Cr2
+from rawphoto.raw import Raw
+from rawphoto.source import BlockCache
+from rawphoto.source import FileSource
+from rawphoto.source import HttpSource
+from rawphoto.source import MmapSource
+from rawphoto.source import RangeSource
+from tests.cr2_test import cr2_multiple_ifds
+from tests.raw_test import _strips_cr2
+from threading import Thread
+
+import os
+import pytest
+import re
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+blob = bytes(bytearray(range(256))) * 4
+
+
+class _RangeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.blob)))
+        self.end_headers()
+
+    def do_GET(self):
+        data = self.server.blob
+        self.server.ranges.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d+)$',
+                         self.headers.get('Range') or '')
+        if match is None or not self.server.ranges_supported:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        start, end = int(match.group(1)), int(match.group(2))
+        if start >= len(data):
+            self.send_response(416)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        end = min(end, len(data) - 1)
+        self.send_response(206)
+        self.send_header('Content-Range',
+                         'bytes {}-{}/{}'.format(start, end, len(data)))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = _RangeServer(('127.0.0.1', 0), _RangeHandler)
+    httpd.blob = blob
+    httpd.ranges = []
+    httpd.ranges_supported = True
+    thread = Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}/file.CR2'.format(httpd.server_port)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def blob_file(tmpdir):
+    tmpdir.join("file.CR2").write_binary(blob)
+    return tmpdir.join("file.CR2").strpath
+
+
+def test_range_source_is_abstract():
+    source = RangeSource()
+    with pytest.raises(NotImplementedError):
+        source.read_range(0, 1)
+    with pytest.raises(NotImplementedError):
+        source.size
+    source.close()
+
+
+@pytest.mark.parametrize('cls', [FileSource, MmapSource])
+def test_local_sources(blob_file, cls):
+    source = cls(blob_file)
+    assert source.size == len(blob)
+    assert source.read_range(10, 4) == blob[10:14]
+    assert source.read_range(len(blob) - 2, 4) == blob[-2:]
+    assert source.read_range(len(blob) + 10, 4) == b''
+    source.close()
+
+
+def test_http_source(server):
+    source = HttpSource(server.url)
+    assert source.size == len(blob)
+    assert source.read_range(10, 4) == blob[10:14]
+    assert server.ranges == ['bytes=10-13']
+    assert source.read_range(len(blob) - 2, 4) == blob[-2:]
+    assert source.read_range(len(blob) + 10, 4) == b''
+    assert source.read_range(0, 0) == b''
+
+
+def test_http_source_needs_range_support(server):
+    server.ranges_supported = False
+    with pytest.raises(IOError):
+        HttpSource(server.url).read_range(0, 4)
+
+
+def test_block_cache_reads_and_seeks(blob_file):
+    with BlockCache(FileSource(blob_file), block_size=64) as f:
+        assert f.name == blob_file
+        assert f.read(4) == blob[:4]
+        assert f.tell() == 4
+        f.seek(60)
+        assert f.read(10) == blob[60:70]
+        f.seek(-2, os.SEEK_CUR)
+        assert f.read(4) == blob[68:72]
+        f.seek(-3, os.SEEK_END)
+        assert f.read() == blob[-3:]
+        assert f.read(4) == b''
+        f.seek(0)
+        assert f.read() == blob
+        with pytest.raises(ValueError):
+            f.seek(-1)
+        with pytest.raises(ValueError):
+            f.seek(0, 5)
+    assert f.closed
+    with pytest.raises(ValueError):
+        f.read()
+
+
+def test_block_cache_hits_and_misses(server):
+    f = BlockCache(HttpSource(server.url), block_size=64, max_blocks=8)
+    assert f.read(10) == blob[:10]
+    assert f.read(10) == blob[10:20]
+    f.seek(100)
+    assert f.read(100) == blob[100:200]
+    assert f.stats == (1, 4, 2, 256)
+    assert server.ranges == ['bytes=0-63', 'bytes=64-255']
+    f.close()
+
+
+def test_block_cache_evicts_least_recently_used(blob_file):
+    f = BlockCache(FileSource(blob_file), block_size=64, max_blocks=2)
+    f.read(1)
+    f.seek(64)
+    f.read(1)
+    f.seek(0)
+    f.read(1)
+    f.seek(128)
+    f.read(1)
+    assert list(f._blocks) == [0, 2]
+    f.close()
+
+
+def test_block_cache_large_reads_bypass_cache(server):
+    f = BlockCache(HttpSource(server.url), block_size=16, max_blocks=4)
+    f.seek(100)
+    assert f.read(600) == blob[100:700]
+    assert len(f._blocks) == 0
+    assert sorted(server.ranges) == [
+        'bytes=100-355', 'bytes=356-611', 'bytes=612-699']
+    f.close()
+
+
+def test_block_cache_prefetch_in_parallel(server):
+    f = BlockCache(HttpSource(server.url), block_size=64)
+    f.prefetch([(0, 10), (300, 10), (40, 30), (900, 10), (1000, 20),
+                (0, 10000)])
+    assert sorted(server.ranges) == [
+        'bytes=0-127', 'bytes=256-319', 'bytes=896-1023']
+    assert sorted(f._blocks) == [0, 1, 4, 14, 15]
+    f.seek(300)
+    assert f.read(10) == blob[300:310]
+    assert len(server.ranges) == 3
+    f.close()
+
+
+class _CountingSource(RangeSource):
+
+    def __init__(self, data):
+        self.data = data
+        self.fetched = 0
+
+    def read_range(self, offset, length):
+        data = self.data[offset:offset + length]
+        self.fetched += len(data)
+        return data
+
+    @property
+    def size(self):
+        return len(self.data)
+
+
+def test_block_cache_prefetch_stops_when_full():
+    source = _CountingSource(blob)
+    f = BlockCache(source, block_size=16, max_blocks=8)
+    ranges = [(offset, 32) for offset in range(0, 640, 64)]
+    f.prefetch(ranges)
+    assert source.fetched == 128
+    for offset, length in ranges:
+        f.seek(offset)
+        assert f.read(length) == blob[offset:offset + length]
+    # Every byte is fetched once; nothing prefetched is evicted unread.
+    assert source.fetched == 320
+    assert f.stats.hits == 8
+    f.close()
+
+
+def test_raw_prefetch_skips_large_runs():
+    source = _CountingSource(_strips_cr2())
+    with Cr2(file=BlockCache(source, block_size=2, max_blocks=4)) as cr2:
+        strips = cr2._get_image_strips()
+        before = source.fetched
+        assert cr2._read_strips(strips) == b'aaaabbcccc'
+        # One read of the coalesced run, including the gap between strips.
+        assert source.fetched - before == 12
+
+
+def test_raw_from_source(server):
+    server.blob = _strips_cr2()
+    with Cr2(source=HttpSource(server.url)) as cr2:
+        assert cr2._get_image_data() == b'aaaabbcccc'
+    # The whole file fits in the first block.
+    assert len(server.ranges) == 1
+
+
+def test_raw_from_source_multiple_ifds(server):
+    server.blob = cr2_multiple_ifds
+    with Cr2(source=HttpSource(server.url)) as cr2:
+        assert len(cr2.ifds) == 4
+        assert cr2.raw_data == b'II'
+
+
+def test_raw_source_is_an_input(blob_file):
+    with pytest.raises(TypeError):
+        Raw(filename=blob_file, source=FileSource(blob_file))
@@ -0,0 +1,141 @@
+from rawphoto import stats
+from rawphoto.cr2 import Cr2
+from rawphoto.pool import HandlePool
+from rawphoto.source import FileSource
+from tests.cr2_header_test import header_bytes
+from tests.raw_test import _ifd
+
+import pytest
+import struct
+
+numpy = pytest.importorskip("numpy")
+
+# A 6x4 sensor with a GRBG pattern; green is 100 + row, red 50, blue 4095.
+width = 4
+height = 6
+pattern = (1, 0, 2, 1)
+samples = [[100 + y if (y + x) % 2 == 0 else (50 if y % 2 == 0 else 4095)
+            for x in range(width)] for y in range(height)]
+
+
+def _raw_cr2(bits=16, compression=1, cfa=True):
+    entries = [
+        (0x0100, 3, 1, width),
+        (0x0101, 3, 1, height),
+        (0x0102, 3, 1, bits),
+        (0x0103, 3, 1, compression),
+        (0x0106, 3, 1, 32803),
+    ]
+    if cfa:
+        entries += [
+            (0x828d, 3, 2, struct.pack('<HH', 2, 2)),
+            (0x828e, 1, 4, struct.pack('<4B', *pattern)),
+        ]
+    data = 16 + 2 + 12 * (len(entries) + 2) + 4
+    # Two strips of three rows, stored in reverse order.
+    strip = width * height
+    entries += [
+        (0x0111, 4, 2, data),
+        (0x0117, 4, 2, data + 8),
+    ]
+    blob = header_bytes + _ifd(entries) + struct.pack(
+        '<4L', data + 16 + strip, data + 16, strip, strip)
+    rows = [struct.pack('<{}H'.format(width), *r) for r in samples]
+    return blob + b''.join(rows[3:]) + b''.join(rows[:3])
+
+
+def test_cfa_pattern():
+    with Cr2(blob=_raw_cr2()) as cr2:
+        assert cr2._get_cfa_pattern(num=0) == ((2, 2), pattern)
+    with Cr2(blob=_raw_cr2(cfa=False)) as cr2:
+        assert cr2._get_cfa_pattern(num=0) is None
+
+
+def test_iter_raw_rows():
+    with Cr2(blob=_raw_cr2()) as cr2:
+        chunks = list(stats.iter_raw_rows(cr2, rows=4))
+    assert [first for first, _ in chunks] == [0, 4]
+    assert [c.shape for _, c in chunks] == [(4, width), (2, width)]
+    assert numpy.vstack([c for _, c in chunks]).tolist() == samples
+
+
+def test_iter_raw_rows_unsupported():
+    with Cr2(blob=_raw_cr2(bits=12)) as cr2:
+        with pytest.raises(NotImplementedError):
+            list(stats.iter_raw_rows(cr2))
+    with Cr2(blob=_raw_cr2(compression=7)) as cr2:
+        with pytest.raises(NotImplementedError):
+            list(stats.iter_raw_rows(cr2))
+    with Cr2(blob=_raw_cr2()[:-2]) as cr2:
+        with pytest.raises(IOError):
+            list(stats.iter_raw_rows(cr2))
+    from tests.cr2_test import cr2_bytes
+    with Cr2(blob=cr2_bytes) as cr2:
+        with pytest.raises(ValueError):
+            list(stats.iter_raw_rows(cr2))
+
+
+def _check(result):
+    assert result.channels == ['G', 'R', 'B', 'G']
+    assert result.counts.tolist() == [6, 6, 6, 6]
+    assert result.minimums.tolist() == [100, 50, 4095, 101]
+    assert result.maximums.tolist() == [104, 50, 4095, 105]
+    assert result.means.tolist() == [102, 50, 4095, 103]
+    assert result.clipped(4095).tolist() == [0, 0, 6, 0]
+    assert result.clipped(4096).tolist() == [0, 0, 0, 0]
+    assert result.clipped(result.maximums.max()).tolist() == [0, 0, 6, 0]
+    with pytest.raises(TypeError):
+        result.clipped()
+    assert result.percentiles(50).tolist() == [102, 50, 4095, 103]
+
+
+@pytest.mark.parametrize("rows", [1, 3, 4, 256])
+def test_sensor_statistics(rows):
+    with Cr2(blob=_raw_cr2()) as cr2:
+        _check(stats.sensor_statistics(cr2, rows=rows))
+
+
+def test_sensor_statistics_in_parallel(tmpdir):
+    tmpdir.join("raw.CR2").write_binary(_raw_cr2())
+    with Cr2(filename=tmpdir.join("raw.CR2").strpath) as cr2:
+        _check(stats.sensor_statistics(cr2, rows=1, processes=2))
+    with Cr2(blob=_raw_cr2()) as cr2:
+        with pytest.raises(TypeError):
+            stats.sensor_statistics(cr2, processes=2)
+
+
+def test_sensor_statistics_in_parallel_needs_local_file(tmpdir):
+    tmpdir.join("raw.CR2").write_binary(_raw_cr2())
+    path = tmpdir.join("raw.CR2").strpath
+    with Cr2(filename=path, pool=HandlePool()) as cr2:
+        _check(stats.sensor_statistics(cr2, rows=1, processes=2))
+    # Named like a file, but not one workers can open.
+    source = FileSource(path)
+    source.name = 'http://127.0.0.1/raw.CR2'
+    with Cr2(source=source) as cr2:
+        _check(stats.sensor_statistics(cr2, rows=1))
+        with pytest.raises(TypeError):
+            stats.sensor_statistics(cr2, processes=2)
+
+
+def test_sensor_statistics_cfa():
+    with Cr2(blob=_raw_cr2(cfa=False)) as cr2:
+        with pytest.raises(ValueError):
+            stats.sensor_statistics(cr2)
+        result = stats.sensor_statistics(cr2, cfa=((1, 2), (1, 0)))
+    assert result.counts.tolist() == [12, 12]
+
+
+def test_cfa_statistics_merge_and_overflow():
+    a = stats.CfaStatistics((1, 1), (6,), bits=2)
+    a.update(numpy.array([[0, 1, 5, 7]]))
+    b = stats.CfaStatistics((1, 1), (6,), bits=2)
+    b.update(numpy.array([[3]]))
+    a.merge(b)
+    assert a.channels == ['W']
+    assert a.histograms.tolist() == [[1, 1, 0, 3]]
+    empty = stats.CfaStatistics((1, 1), (9,))
+    assert empty.channels == ['9']
+    assert empty.minimums.tolist() == [0]
+    assert empty.maximums.tolist() == [0]
+    assert empty.means.tolist() == [0]
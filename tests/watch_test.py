@@ -0,0 +1,200 @@
+from rawphoto import watch
+from rawphoto.cr2 import Cr2
+from tests.cr2_test import cr2_bytes
+
+import os
+import pytest
+import time
+
+
+class Clock(object):
+
+    def __init__(self):
+        # Start well after any file was modified, like a real watcher.
+        self.now = time.time() + 100
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _bump_mtime(path, clock):
+    # Make directory changes visible however coarse the filesystem clock is.
+    os.utime(path, (clock.now, clock.now))
+
+
+def test_existing_files_are_ignored(tmpdir, clock):
+    tmpdir.join("old.CR2").write_binary(cr2_bytes)
+    watcher = watch.Watcher(tmpdir.strpath, clock=clock)
+    clock.now += 10
+    assert watcher.poll() == []
+
+
+def test_include_existing(tmpdir, clock):
+    tmpdir.join("old.CR2").write_binary(cr2_bytes)
+    tmpdir.join("notes.txt").write("")
+    watcher = watch.Watcher(tmpdir.strpath, include_existing=True,
+                            clock=clock)
+    clock.now += 10
+    assert watcher.poll() == [tmpdir.join("old.CR2").strpath]
+    assert watcher.poll() == []
+
+
+def test_new_files_wait_until_settled(tmpdir, clock):
+    watcher = watch.Watcher(tmpdir.strpath, settle=1.0, debounce=0.5,
+                            clock=clock)
+    new = tmpdir.join("new.CR2")
+    new.write_binary(cr2_bytes[:10])
+    _bump_mtime(tmpdir.strpath, clock)
+    assert watcher.poll() == []
+
+    # Still being written.
+    clock.now += 0.8
+    new.write_binary(cr2_bytes)
+    os.utime(new.strpath, (clock.now, clock.now))
+    assert watcher.poll() == []
+    clock.now += 0.8
+    assert watcher.poll() == []
+    clock.now += 0.3
+    assert watcher.poll() == [new.strpath]
+    clock.now += 10
+    assert watcher.poll() == []
+
+
+def test_bursts_are_debounced(tmpdir, clock):
+    watcher = watch.Watcher(tmpdir.strpath, settle=1.0, debounce=2.0,
+                            max_delay=5.0, clock=clock)
+    tmpdir.join("1.CR2").write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    watcher.poll()
+    clock.now += 1.5
+    tmpdir.join("2.CR2").write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    # 1.CR2 has settled, but 2.CR2 just arrived.
+    assert watcher.poll() == []
+    clock.now += 1.5
+    assert watcher.poll() == []
+    clock.now += 0.5
+    assert watcher.poll() == [tmpdir.join(f).strpath
+                              for f in ["1.CR2", "2.CR2"]]
+
+
+def test_max_delay(tmpdir, clock):
+    watcher = watch.Watcher(tmpdir.strpath, settle=0, debounce=10,
+                            max_delay=3, clock=clock)
+    released = []
+    for i in range(5):
+        tmpdir.join("{}.CR2".format(i)).write_binary(cr2_bytes)
+        _bump_mtime(tmpdir.strpath, clock)
+        released.append(len(watcher.poll()))
+        clock.now += 1
+    assert released == [0, 0, 0, 4, 0]
+
+
+def test_new_and_removed_directories(tmpdir, clock):
+    watcher = watch.Watcher(tmpdir.strpath, settle=0, debounce=0,
+                            clock=clock)
+    sub = tmpdir.mkdir("sub").mkdir("deeper")
+    sub.join("a.nef").write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    assert watcher.poll() == [sub.join("a.nef").strpath]
+    sub.join("a.nef").remove()
+    tmpdir.join("sub").remove()
+    _bump_mtime(tmpdir.strpath, clock)
+    assert watcher.poll() == []
+    assert set(watcher._dirs) == set([tmpdir.strpath])
+    assert watcher._files == {}
+
+
+def test_removed_before_settled(tmpdir, clock):
+    watcher = watch.Watcher(tmpdir.strpath, clock=clock)
+    tmpdir.join("gone.CR2").write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    watcher.poll()
+    os.remove(tmpdir.join("gone.CR2").strpath)
+    clock.now += 10
+    assert watcher.poll() == []
+    assert watcher._pending == {}
+
+
+def test_unchanged_directories_are_not_listed(tmpdir, clock, monkeypatch):
+    tmpdir.mkdir("a").join("x.CR2").write_binary(cr2_bytes)
+    tmpdir.mkdir("b")
+    watcher = watch.Watcher(tmpdir.strpath, clock=clock)
+    listed = []
+
+    def listdir(path):
+        listed.append(path)
+        return os.listdir(path)
+    monkeypatch.setattr(watch.os, 'listdir', listdir)
+    clock.now += 10
+    assert watcher.poll() == []
+    assert listed == []
+
+
+def test_full_poll_finds_files_modified_in_place(tmpdir, clock):
+    tmpdir.join("edit.CR2").write_binary(cr2_bytes)
+    watcher = watch.Watcher(tmpdir.strpath, settle=0, debounce=0,
+                            clock=clock)
+    clock.now += 10
+    with open(tmpdir.join("edit.CR2").strpath, "ab") as f:
+        f.write(b'\x00')
+    assert watcher.poll() == []
+    assert watcher.poll(full=True) == [tmpdir.join("edit.CR2").strpath]
+
+
+def test_parse(tmpdir, clock):
+    tmpdir.join("good.CR2").write_binary(cr2_bytes)
+    tmpdir.join("bad.CR2").write_binary(b'II*\x00')
+    watcher = watch.Watcher(tmpdir.strpath, clock=clock)
+    paths = [tmpdir.join(f).strpath for f in ["bad.CR2", "good.CR2"]]
+    parsed = list(watcher.parse(paths))
+    assert [p for p, _ in parsed] == paths[1:]
+    assert isinstance(parsed[0][1], Cr2)
+    parsed[0][1].close()
+    assert list(watcher.errors) == paths[:1]
+
+
+def test_watch(tmpdir, clock, monkeypatch):
+    watcher = watch.Watcher(tmpdir.strpath, settle=0, debounce=0,
+                            clock=clock)
+    monkeypatch.setattr(watch.time, 'sleep', lambda s: None)
+    tmpdir.join("new.CR2").write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    path, raw = next(watcher.watch(full_every=1))
+    raw.close()
+    assert path == tmpdir.join("new.CR2").strpath
+
+
+def test_rescan_only_stats_new_entries(tmpdir, clock, monkeypatch):
+    for i in range(50):
+        tmpdir.join("IMG_{:04d}.CR2".format(i)).write_binary(cr2_bytes)
+    tmpdir.join("notes.txt").write("")
+    watcher = watch.Watcher(tmpdir.strpath, settle=1.0, debounce=0.5,
+                            clock=clock)
+    clock.now += 10
+
+    stat = os.stat
+    isdir = os.path.isdir
+    calls = []
+
+    def counting_stat(path, *args, **kwargs):
+        calls.append(path)
+        return stat(path, *args, **kwargs)
+
+    def counting_isdir(path):
+        calls.append(path)
+        return isdir(path)
+
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    monkeypatch.setattr(os.path, 'isdir', counting_isdir)
+    new = tmpdir.join("IMG_0050.CR2")
+    new.write_binary(cr2_bytes)
+    _bump_mtime(tmpdir.strpath, clock)
+    assert watcher.poll() == []
+    files = set(c for c in calls if c != tmpdir.strpath)
+    assert files == set([new.strpath])